@@ -0,0 +1,274 @@
+# app/agemodel.py
+
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, UploadFile, File, HTTPException
+
+from app.memory import read_limited, parse_csv
+
+logger = logging.getLogger("app.agemodel")
+router = APIRouter(prefix="/api/age-models", tags=["AgeModels"])
+
+# ─────── CONFIG ───────
+AGE_MODEL_DIR = Path(os.environ.get("AGE_MODEL_DIR", "age_models"))
+DEPTH_COLUMNS = ("depth_sample", "depth")
+AGE_COLUMNS   = ("interp_age", "age")          # years BP, SISAL convention
+SYNTHETIC_SPAN = (-10000, 5000)                # legacy axis when no ages are known
+
+# ─────── Index ───────────
+def _canonical(uniques) -> np.ndarray:
+    s = pd.Series(np.asarray(uniques, dtype=object))
+    num = pd.to_numeric(s, errors="coerce")
+    integral = np.isfinite(num) & (num == np.floor(num))
+    keys = s.astype(str).str.strip().to_numpy(dtype=object)
+    keys[integral.to_numpy()] = num[integral].astype(np.int64).astype(str).to_numpy()
+    return keys.astype(str)
+
+def factorize_entities(ids) -> Tuple[np.ndarray, np.ndarray]:
+    """(codes, keys): the canonical key of every distinct id, and each row's
+    code into it (-1 for a missing id). Only the distinct ids are converted,
+    so the per-row cost is one hash pass."""
+    codes, uniques = pd.factorize(np.atleast_1d(np.asarray(ids)))
+    return codes, _canonical(uniques)
+
+def entity_keys(ids) -> np.ndarray:
+    """Entity ids as canonical strings, so int (12), float (12.0) and string
+    ("12") spellings of one id compare equal. Missing ids become ""."""
+    codes, keys = factorize_entities(ids)
+    return np.append(keys, "")[codes]
+
+class AgeModelIndex:
+    """Piecewise-linear depth→age models for every entity, in flat arrays.
+
+    Tie points of all entities are stored back to back, sorted by (entity
+    key, depth); entities are matched on ``entity_keys``. Each depth is
+    encoded as ``entity_rank + position in [0, 1)`` along the entity's depth
+    range, so one ``searchsorted`` over the whole key array locates the
+    bracketing tie points for any mix of entities.
+    """
+
+    def __init__(self, tiepoints: pd.DataFrame):
+        tp = tiepoints.dropna()
+        tp = tp.assign(entity=entity_keys(tp["entity_id"]))
+        labels = tp.groupby("entity", sort=True)["entity_id"].first()
+        tp = (
+            tp.groupby(["entity", "depth"], as_index=False)["age"].mean()
+            .sort_values(["entity", "depth"], kind="stable")
+        )
+        counts = tp.groupby("entity", sort=True).size()
+        keep = counts.index[counts >= 2]                 # need a segment to interpolate
+        tp = tp[tp["entity"].isin(keep)]
+
+        self.entities = np.asarray(keep, dtype=str)
+        self.labels = labels.loc[keep].to_numpy()        # ids as spelled in the tie points
+        self.depth = tp["depth"].to_numpy(dtype=np.float64)
+        self.age = tp["age"].to_numpy(dtype=np.float64)
+        n_per = counts[counts >= 2].to_numpy()
+        self.start = (np.cumsum(n_per) - n_per).astype(np.intp)
+        self.stop = (self.start + n_per).astype(np.intp)
+
+        rank = np.repeat(np.arange(len(self.entities)), n_per)
+        self.dmin = self.depth[self.start]
+        self.dspan = self.depth[self.stop - 1] - self.dmin
+        self.keys = rank + self._unit(self.depth, rank)
+
+    def _unit(self, depth: np.ndarray, rank: np.ndarray) -> np.ndarray:
+        # position along the entity's depth range, clipped just below 1 so
+        # keys of consecutive entities never overlap
+        u = (depth - self.dmin[rank]) / self.dspan[rank]
+        return np.clip(u, 0.0, np.nextafter(1.0, 0.0))
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def ages(self, entity_ids: np.ndarray, depths: np.ndarray) -> np.ndarray:
+        """Age (years BP) of every row; NaN where the entity has no model or
+        the depth is missing. Depths outside an entity's tie points are
+        extrapolated along its first/last segment."""
+        depths = np.asarray(depths, dtype=np.float64)
+        out = np.full(len(depths), np.nan)
+        if len(self) == 0 or len(depths) == 0:
+            return out
+
+        # match the distinct ids only, then broadcast through the codes;
+        # the extra slot at the end catches code -1 (missing id)
+        codes, keys = factorize_entities(entity_ids)
+        rank = np.searchsorted(self.entities, keys)
+        rank_c = np.minimum(rank, len(self.entities) - 1)
+        matched = (rank < len(self.entities)) & (self.entities[rank_c] == keys)
+        rank_c = np.append(rank_c, 0)[codes]
+        known = np.append(matched, False)[codes] & np.isfinite(depths)
+        r = rank_c[known]
+        d = depths[known]
+
+        hi = np.searchsorted(self.keys, r + self._unit(d, r), side="right")
+        hi = np.clip(hi, self.start[r] + 1, self.stop[r] - 1)
+        lo = hi - 1
+        d0, d1 = self.depth[lo], self.depth[hi]
+        a0, a1 = self.age[lo], self.age[hi]
+        out[known] = a0 + (d - d0) * (a1 - a0) / (d1 - d0)
+        return out
+
+    def depth_range(self, entity_id, age_min: float, age_max: float) -> Optional[Tuple[float, float]]:
+        """Depth interval whose interpolated ages fall within [age_min, age_max]."""
+        key = entity_keys([entity_id])[0]
+        i = np.searchsorted(self.entities, key)
+        if i >= len(self.entities) or self.entities[i] != key:
+            return None
+        depth = self.depth[self.start[i] : self.stop[i]]
+        age = self.age[self.start[i] : self.stop[i]]
+        d0, d1, a0, a1 = depth[:-1], depth[1:], age[:-1], age[1:]
+        # fraction of each segment whose linear age lies inside the window
+        slope = a1 - a0
+        flat = slope == 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_a = (age_min - a0) / slope
+            t_b = (age_max - a0) / slope
+        t_lo = np.where(flat, 0.0, np.clip(np.minimum(t_a, t_b), 0, 1))
+        t_hi = np.where(flat, 1.0, np.clip(np.maximum(t_a, t_b), 0, 1))
+        hit = np.where(
+            flat,
+            (a0 >= age_min) & (a0 <= age_max),
+            (np.maximum(t_a, t_b) >= 0) & (np.minimum(t_a, t_b) <= 1),
+        )
+        if not hit.any():
+            return None
+        lo = d0[hit] + t_lo[hit] * (d1[hit] - d0[hit])
+        hi = d0[hit] + t_hi[hit] * (d1[hit] - d0[hit])
+        return float(lo.min()), float(hi.max())
+
+    def summary(self) -> list:
+        return [
+            {
+                "entity_id": e.item() if hasattr(e, "item") else e,
+                "n_tiepoints": int(b - a),
+                "depth": [float(self.depth[a]), float(self.depth[b - 1])],
+                "age": [float(self.age[a : b].min()), float(self.age[a : b].max())],
+            }
+            for e, a, b in zip(self.labels, self.start, self.stop)
+        ]
+
+# ─────── Store ───────────
+def _pick(df: pd.DataFrame, names: Tuple[str, ...]) -> Optional[str]:
+    return next((c for c in names if c in df.columns), None)
+
+def normalize_tiepoints(df: pd.DataFrame) -> pd.DataFrame:
+    depth_col, age_col = _pick(df, DEPTH_COLUMNS), _pick(df, AGE_COLUMNS)
+    if "entity_id" not in df.columns or depth_col is None or age_col is None:
+        raise ValueError(
+            f"tie points need entity_id, one of {DEPTH_COLUMNS} and one of {AGE_COLUMNS}"
+        )
+    out = df[["entity_id", depth_col, age_col]].copy()
+    out.columns = ["entity_id", "depth", "age"]
+    out["depth"] = pd.to_numeric(out["depth"], errors="coerce")
+    out["age"] = pd.to_numeric(out["age"], errors="coerce")
+    return out
+
+def load_index(directory: Path = AGE_MODEL_DIR) -> AgeModelIndex:
+    frames = []
+    for path in sorted(directory.glob("*.csv")) if directory.is_dir() else []:
+        try:
+            frames.append(normalize_tiepoints(pd.read_csv(path)))
+        except Exception as e:
+            logger.warning(f"[agemodel] skipping {path.name}: {e}")
+    tiepoints = pd.concat(frames) if frames else pd.DataFrame(columns=["entity_id", "depth", "age"])
+    index = AgeModelIndex(tiepoints)
+    logger.info(f"[agemodel] {len(index)} entity age models loaded")
+    return index
+
+_index: Optional[AgeModelIndex] = None
+_index_lock = threading.Lock()
+
+def get_index() -> AgeModelIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_index()
+    return _index
+
+def reload_index() -> AgeModelIndex:
+    global _index
+    index = load_index()
+    _index = index   # atomic swap; readers keep the index they started with
+    return index
+
+def time_axis(df: pd.DataFrame, offset: int = 0) -> Tuple[np.ndarray, str]:
+    """x-axis for upload rows ``offset:`` in years relative to present
+    (negative = past), plus where it came from: the upload's own age column,
+    the stored age models, or the legacy synthetic span when neither dates
+    any row. Sequence models pass ``offset=time_steps``."""
+    age_col, depth_col = _pick(df, AGE_COLUMNS), _pick(df, DEPTH_COLUMNS)
+    if age_col is not None:
+        ages = pd.to_numeric(df[age_col], errors="coerce").to_numpy(dtype=np.float64)
+        source = "upload"
+    elif "entity_id" in df.columns and depth_col is not None:
+        depth = pd.to_numeric(df[depth_col], errors="coerce").to_numpy(dtype=np.float64)
+        ages = get_index().ages(df["entity_id"].to_numpy(), depth)
+        source = "age_model"
+    else:
+        ages = np.full(len(df), np.nan)
+    ages = ages[offset:]
+    if not np.isfinite(ages).any():
+        return np.linspace(*SYNTHETIC_SPAN, len(ages)), "synthetic"
+    return -ages, source
+
+def plot_order(years: np.ndarray, predictions: Dict[str, list]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Sort an axis (and its series) chronologically for line plots."""
+    order = np.argsort(years, kind="stable")
+    return years[order], {t: np.asarray(v)[order] for t, v in predictions.items()}
+
+def json_axis(years: np.ndarray) -> list:
+    return [None if not np.isfinite(y) else float(y) for y in years]
+
+# ─────── ENDPOINTS ───────
+@router.get("")
+def list_age_models() -> Dict[str, Any]:
+    index = get_index()
+    return {"n_entities": len(index), "entities": index.summary()}
+
+@router.post("")
+def upload_age_models(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """Store a tie-point CSV (entity_id, depth, age in years BP) and rebuild."""
+    df = parse_csv(read_limited(file))
+    try:
+        tiepoints = normalize_tiepoints(df)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if tiepoints.dropna().empty:
+        raise HTTPException(400, "Uploaded file has no usable tie points")
+
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", Path(file.filename or "tiepoints").stem) or "tiepoints"
+    AGE_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = AGE_MODEL_DIR / f".{stem}.csv.tmp"
+    tiepoints.to_csv(tmp, index=False)
+    os.replace(tmp, AGE_MODEL_DIR / f"{stem}.csv")
+    index = reload_index()
+    return {"stored": f"{stem}.csv", "n_entities": len(index)}
+
+@router.post("/map")
+def map_depths(file: UploadFile = File(...)) -> Dict[str, Any]:
+    """Ages for every row of an upload with entity_id and depth_sample."""
+    df = parse_csv(read_limited(file))
+    depth_col = _pick(df, DEPTH_COLUMNS)
+    if "entity_id" not in df.columns or depth_col is None:
+        raise HTTPException(400, "Upload needs entity_id and depth_sample columns")
+    ages = get_index().ages(df["entity_id"].to_numpy(), pd.to_numeric(df[depth_col], errors="coerce"))
+    return {"n_rows": int(len(df)), "n_dated": int(np.isfinite(ages).sum()), "age": json_axis(ages)}
+
+@router.get("/{entity_id}/range")
+def depth_range_for_ages(entity_id: int, year_min: float, year_max: float) -> Dict[str, Any]:
+    """Depth interval of an entity between two years (negative = BP)."""
+    if year_min > year_max:
+        raise HTTPException(400, "year_min must not exceed year_max")
+    rng = get_index().depth_range(entity_id, -year_max, -year_min)
+    if rng is None:
+        raise HTTPException(404, f"No age model covers entity {entity_id} in that range")
+    return {"entity_id": entity_id, "year_min": year_min, "year_max": year_max, "depth_min": rng[0], "depth_max": rng[1]}
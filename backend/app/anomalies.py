@@ -0,0 +1,140 @@
+# app/anomalies.py
+
+import os
+import numpy as np
+from typing import Dict, Any, Optional
+from fastapi import HTTPException
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ─────── CONFIG ───────
+DEFAULT_WINDOW    = int(os.environ.get("ANOMALY_WINDOW", "25"))
+DEFAULT_THRESHOLD = float(os.environ.get("ANOMALY_THRESHOLD", "3.5"))
+MIN_WINDOW        = 3
+MAX_WINDOW        = int(os.environ.get("ANOMALY_MAX_WINDOW", "1001"))
+SCRATCH_BYTES     = int(os.environ.get("ANOMALY_SCRATCH_MB", "64")) * 1024 * 1024   # per rolling pass
+MAD_SCALE         = 0.6745      # makes MAD-based z comparable to a normal z
+
+# ─────── Helpers ───────────
+def check_window(window: int) -> None:
+    """Reject a window outside [MIN_WINDOW, MAX_WINDOW] before any work.
+    Scratch memory is capped by SCRATCH_BYTES; the window bounds time."""
+    if not MIN_WINDOW <= window <= MAX_WINDOW:
+        raise HTTPException(400, f"anomaly_window must be between {MIN_WINDOW} and {MAX_WINDOW}")
+
+def _group_median(sorted_vals: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Median of each contiguous group in an array sorted by (group, value)."""
+    lo = sorted_vals[starts + (counts - 1) // 2]
+    hi = sorted_vals[starts + counts // 2]
+    return (lo + hi) / 2
+
+def _group_sort(vals: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Order by (group, value): a value argsort refined by a stable radix
+    sort on the integer group codes — about twice as fast as np.lexsort."""
+    o = np.argsort(vals)
+    return o[np.argsort(codes[o], kind="stable")]
+
+def _rolling_median_mad(v: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """Centred rolling median and MAD over an edge-padded series.
+
+    Windows are strided views; each chunk is partitioned in one reusable
+    buffer of at most SCRATCH_BYTES, allocated only once."""
+    h = window // 2
+    windows = sliding_window_view(np.pad(v, h, mode="edge"), window)
+    med = np.empty(len(v))
+    mad = np.empty(len(v))
+    chunk = max(1, SCRATCH_BYTES // (8 * window))
+    buf = np.empty((min(chunk, len(v)), window))
+    for s in range(0, len(v), chunk):
+        w = windows[s : s + chunk]
+        b = buf[: len(w)]
+        b[...] = w
+        b.partition(h, axis=1)
+        m = b[:, h].copy()
+        med[s : s + len(m)] = m
+        np.subtract(w, m[:, None], out=b)
+        np.abs(b, out=b)
+        b.partition(h, axis=1)
+        mad[s : s + len(m)] = b[:, h]
+    return med, mad
+
+def robust_zscores(
+    residuals: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    window: int = DEFAULT_WINDOW,
+) -> np.ndarray:
+    """Rolling robust z-score of every residual, computed within its group.
+
+    Rows are sorted by group once; windows that would cross a group boundary
+    fall back to the whole group's median/MAD, so no window ever mixes two
+    entities and no per-group Python loop is needed.
+    """
+    v = np.asarray(residuals, dtype=np.float64)
+    n = len(v)
+    if n == 0:
+        return np.zeros(0)
+    check_window(window)
+    window = window | 1  # odd, so the median is a single element
+    h = window // 2
+
+    finite = np.isfinite(v)
+    if not finite.all():
+        # score measured rows among themselves, so gaps neither count as
+        # anomalies nor flatten their neighbours' windows; gaps score 0
+        scores = np.zeros(n)
+        if finite.any():
+            sub = None if groups is None else np.asarray(groups)[finite]
+            scores[finite] = robust_zscores(v[finite], sub, window)
+        return scores
+
+    if groups is None:
+        codes = np.zeros(n, dtype=np.intp)
+    else:
+        _, codes = np.unique(np.asarray(groups), return_inverse=True)
+    order = _group_sort(v, codes)
+    sv, sc = v[order], codes[order]
+    starts = np.flatnonzero(np.r_[True, sc[1:] != sc[:-1]])
+    counts = np.diff(np.r_[starts, n])
+
+    # whole-group median / MAD (fallback near group edges)
+    gid = np.repeat(np.arange(len(starts)), counts)
+    g_med = _group_median(sv, starts, counts)
+    dev = np.abs(sv - g_med[gid])
+    g_mad = _group_median(dev[_group_sort(dev, gid)], starts, counts)
+
+    # rolling stats in original row order within each group
+    row_order = np.argsort(codes, kind="stable")
+    rv = v[row_order]
+    pos = np.arange(n) - starts[gid]
+    med, mad = _rolling_median_mad(rv, window)
+    edge = (pos < h) | (pos >= counts[gid] - h)
+    med[edge] = g_med[gid[edge]]
+    mad[edge] = g_mad[gid[edge]]
+
+    z = np.zeros(n)
+    ok = mad > 0
+    z[ok] = MAD_SCALE * (rv[ok] - med[ok]) / mad[ok]
+
+    scores = np.empty(n)
+    scores[row_order] = z
+    return scores
+
+def detect_anomalies(
+    residuals: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    window: int = DEFAULT_WINDOW,
+    threshold: float = DEFAULT_THRESHOLD,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """Flag residuals whose rolling robust |z| exceeds ``threshold``.
+
+    ``offset`` shifts the returned indices back onto upload rows (sequence
+    models lose their first ``time_steps`` rows)."""
+    scores = robust_zscores(residuals, groups, window)
+    flagged = np.flatnonzero(np.abs(scores) > threshold)
+    return {
+        "window": int(window | 1),
+        "threshold": float(threshold),
+        "n_flagged": int(len(flagged)),
+        "indices": (flagged + offset).tolist(),
+        "scores": np.round(scores[flagged], 4).tolist(),
+    }
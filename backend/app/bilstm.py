@@ -1,6 +1,6 @@
 # app/bilstm.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import pandas as pd
 import numpy as np
 import joblib
@@ -19,8 +19,15 @@ import scipy.stats as stats
 import base64
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
 
+from app.catalog import catalog
+from app.agemodel import time_axis, plot_order, json_axis
+from app.anomalies import detect_anomalies, check_window, DEFAULT_WINDOW, DEFAULT_THRESHOLD
+from app.datasets import read_upload, bundle_columns
+from app.memory import MemoryProfile, figure_guard, release_keras, keras_model_bytes
+from app.uncertainty import mc_dropout_predict, check_passes, DEFAULT_PASSES
+
 logger = logging.getLogger("app.bilstm")
-router = APIRouter(prefix="/api/analyze/bilstm", tags=["BiLSTM"])
+router = APIRouter(prefix="/api/analyze/bilstm", tags=["BiLSTM"], dependencies=[Depends(figure_guard)])
 
 # ─────── CONFIG ───────
 MODEL_SAVE_DIR = Path("saved_models_bilstm")
@@ -31,6 +38,11 @@ TARGET_VARIABLES = [
     "Sr_Ca_measurement",
 ]
 
+catalog.register_family(
+    "bilstm", MODEL_SAVE_DIR, "BiLSTM_", ".keras", lambda p: load_model(str(p)),
+    release=release_keras, sizer=keras_model_bytes,
+)
+
 # ─────────── Helpers ───────────
 def create_sequences(
     X: pd.DataFrame,
@@ -75,16 +87,25 @@ def create_time_series_plot(years: np.ndarray, predictions: Dict[str, list]) ->
 
 # ─────── PREDICTION ───────
 async def predict_with_saved_model(
-    df: pd.DataFrame, model_id: str
+    df: pd.DataFrame,
+    model_id: str,
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
+    uncertainty: bool = False,
+    mc_passes: int = DEFAULT_PASSES,
+    profile: MemoryProfile | None = None,
 ) -> Dict[str, Any]:
-    model_dir = MODEL_SAVE_DIR / model_id
-    if not model_dir.exists():
+    profile = profile or MemoryProfile()
+    if not (MODEL_SAVE_DIR / model_id).exists():
         raise HTTPException(404, f"Model '{model_id}' not found")
 
     try:
-        # 1) Load metadata (for time_steps & any CV metrics)
-        with open(model_dir / "metadata.json", "r") as f:
-            metadata = json.load(f)
+        # 1) Current bundle from the catalog (metadata for time_steps & CV metrics)
+        bundle = catalog.get("bilstm", model_id)
+        if bundle is None:
+            raise HTTPException(404, f"Model '{model_id}' not found")
+        metadata = bundle.metadata
 
         time_steps = (
             metadata.get("time_steps")
@@ -92,14 +113,18 @@ async def predict_with_saved_model(
             or 10
         )
 
-        # 2) Load scaler + encoders
-        scaler = joblib.load(model_dir / "scaler.pkl")
-        label_encoders = joblib.load(model_dir / "label_encoders.pkl")
+        # 2) Scaler + encoders
+        scaler = bundle.scaler
+        label_encoders = bundle.label_encoders
 
         # 3) Preprocess incoming df
+        entity_ids = df["entity_id"].to_numpy() if "entity_id" in df.columns else None
+        years, time_axis_source = time_axis(df, offset=time_steps)
         drop_cols = ["sample_id", "site_id", "entity_id", "site_name"]
         df = df.drop(columns=[c for c in drop_cols if c in df.columns], errors="ignore")
 
+        # rows where a target was measured; imputation below hides the gaps
+        measured = {t: df[t].notna().to_numpy() for t in bundle.targets if t in df.columns}
         num_cols = df.select_dtypes(include=["float64", "int64"]).columns
         df[num_cols] = df[num_cols].fillna(df[num_cols].median())
         for col, le in label_encoders.items():
@@ -108,26 +133,20 @@ async def predict_with_saved_model(
         df[num_cols] = scaler.transform(df[num_cols])
 
         X = df.drop(columns=TARGET_VARIABLES, errors="ignore")
+        profile.mark("preprocess")
 
-        # 4) Determine targets
-        if "target_variables" in metadata:
-            targets = metadata["target_variables"]
-        else:
-            targets = [
-                p.stem.replace("BiLSTM_", "")
-                for p in model_dir.glob("BiLSTM_*.keras")
-            ]
+        # 4) Targets with a loaded model
+        targets = bundle.targets
 
         # 5) Predict, compute metrics & plots
         future_past = {}
         eval_metrics = {}
         plots = {}
+        anomaly_results = {}
+        uncertainty_results = {}
 
         for t in targets:
-            model_path = model_dir / f"BiLSTM_{t}.keras"
-            if not model_path.exists():
-                continue
-            m = load_model(str(model_path))
+            m = bundle.models[t]
 
             # create seqs
             dummy_y = pd.Series(np.zeros(len(X)))
@@ -137,6 +156,9 @@ async def predict_with_saved_model(
             # store preds
             future_past[t] = preds.tolist()
 
+            if uncertainty:
+                uncertainty_results[t] = mc_dropout_predict(m, X_seq, mc_passes)
+
             # compute metrics on the **actual** series
             # re-create true y for this target
             _, y_true_full = create_sequences(X, pd.Series(df[t].values), time_steps)
@@ -149,36 +171,55 @@ async def predict_with_saved_model(
 
             eval_metrics[t] = {"r2": r2, "mae": mae, "rmse": rmse}
 
+            if anomalies:
+                # residual i belongs to upload row i + time_steps; unmeasured rows score 0
+                rows = slice(time_steps, time_steps + len(y_true_arr))
+                groups = entity_ids[rows] if entity_ids is not None else None
+                residuals = np.where(measured[t][rows], y_true_arr - y_pred_arr, np.nan)
+                anomaly_results[t] = detect_anomalies(
+                    residuals, groups, anomaly_window, anomaly_threshold, offset=time_steps
+                )
+
             # build residual & QQ plots
             plots[t] = {
                 "residual_plot": plot_to_base64(create_residual_plot(y_true_arr, y_pred_arr, t)),
                 "qq_plot":       plot_to_base64(create_qq_plot(y_true_arr, y_pred_arr, t)),
             }
 
-        # 6) Build time axis for full series
-        n = max((len(v) for v in future_past.values()), default=0)
-        years = np.linspace(-10000, 5000, n).tolist()
-        time_series_plot = plot_to_base64(create_time_series_plot(np.array(years), future_past))
+        profile.mark("targets")
+
+        # 6) Plot the full series on the age-model axis
+        time_series_plot = plot_to_base64(create_time_series_plot(*plot_order(years, future_past)))
 
         # 7) Pull any stored cross‐validation metrics (optional)
         cv_metrics = metadata.get("cv_metrics", {})
 
         # 8) Return exactly as your React app expects:
+        results = {
+            "future_past_predictions":   future_past,
+            "years":                     json_axis(years),
+            "time_axis":                 time_axis_source,
+            "preprocessing":             metadata.get("preprocessing_info", {}),
+            "training_metrics":          eval_metrics,
+            "evaluation_metrics":        eval_metrics,
+            "training_cross_validation": cv_metrics,
+            "plots":                     plots,
+            "time_series_plot":          time_series_plot,
+        }
+        if anomalies:
+            results["anomalies"] = anomaly_results
+        if uncertainty:
+            results["uncertainty"] = uncertainty_results
+        profile.mark("summary_plot")
+        results["memory"] = profile.report()
         return {
             "status": "success",
-            "results": {
-                "future_past_predictions":   future_past,
-                "years":                     years,
-                "preprocessing":             metadata.get("preprocessing_info", {}),
-                "training_metrics":          eval_metrics,
-                "evaluation_metrics":        eval_metrics,
-                "training_cross_validation": cv_metrics,
-                "plots":                     plots,
-                "time_series_plot":          time_series_plot,
-            },
+            "results": results,
             "model_id": model_id,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error loading model {model_id}: {e}", exc_info=True)
         raise HTTPException(400, f"Error loading model: {e}")
@@ -186,14 +227,24 @@ async def predict_with_saved_model(
 # ─────── ENDPOINT ───────
 @router.post("/predict")
 async def predict_bilstm(
-    file: UploadFile = File(...),
+    file: UploadFile | None = File(None),
+    dataset_id: str | None = None,
     model_id: str | None = None,
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
+    uncertainty: bool = False,
+    mc_passes: int = DEFAULT_PASSES,
 ) -> Dict[str, Any]:
-    contents = await file.read()
-    df = pd.read_csv(BytesIO(contents))
-    if df.empty:
-        raise HTTPException(400, "Uploaded file is empty")
-
+    if anomalies:
+        check_window(anomaly_window)
+    if uncertainty:
+        check_passes(mc_passes)
     # default to your pretrained folder
     model_id = model_id or "pretrained_bilstm"
-    return await predict_with_saved_model(df, model_id)
+    profile = MemoryProfile()
+    df = await read_upload(file, dataset_id, bundle_columns("bilstm", model_id) if dataset_id else None)
+    profile.mark("upload")
+    return await predict_with_saved_model(
+        df, model_id, anomalies, anomaly_window, anomaly_threshold, uncertainty, mc_passes, profile
+    )
@@ -0,0 +1,334 @@
+# app/catalog.py
+
+import os
+import json
+import time
+import pickle
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import joblib
+from fastapi import APIRouter, HTTPException
+
+logger = logging.getLogger("app.catalog")
+router = APIRouter(prefix="/api/models", tags=["Models"])
+
+# ─────── CONFIG ───────
+POLL_SECONDS    = float(os.environ.get("MODEL_CATALOG_POLL_SECONDS", "5"))
+PRELOAD_WORKERS = int(os.environ.get("MODEL_CATALOG_PRELOAD_WORKERS", "2"))
+BASE_FILES      = ("metadata.json", "scaler.pkl", "label_encoders.pkl")
+
+# ─────── Types ───────────
+@dataclass(frozen=True)
+class FamilySpec:
+    name: str
+    root: Path
+    prefix: str                      # per-target file prefix, e.g. "RF_"
+    suffix: str                      # per-target file suffix, e.g. ".pkl"
+    loader: Callable[[Path], Any]    # loads one per-target model file
+    required: Tuple[str, ...] = BASE_FILES
+    release: Optional[Callable[[Any], None]] = None   # called with a bundle once it is swapped out
+    sizer: Optional[Callable[[Any], int]] = None      # resident bytes of one loaded model file
+
+@dataclass
+class ModelBundle:
+    """A fully loaded, immutable model version. Routers keep a reference for
+    the whole request, so a swap never pulls artifacts out from under them."""
+    family: str
+    model_id: str
+    path: Path
+    version: Tuple[int, int, int]
+    metadata: Dict[str, Any]
+    scaler: Any
+    label_encoders: Dict[str, Any]
+    models: Dict[str, Any]
+    targets: list
+    documents: Dict[str, Any] = field(default_factory=dict)
+    disk_bytes: int = 0              # size of the bundle folder
+    memory_bytes: int = 0            # estimated resident size of models and preprocessors
+    loaded_at: float = field(default_factory=time.time)
+
+class BundleError(ValueError):
+    """Raised when a model folder does not form a valid bundle."""
+
+# ─────── Helpers ───────────
+def pickled_bytes(obj: Any) -> int:
+    """Resident-size estimate for estimators and preprocessors: the length of
+    their pickle, which is dominated by the same arrays they hold in memory."""
+    return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+def bundle_signature(path: Path) -> Tuple[int, int, int]:
+    """(file count, total bytes, newest mtime) — changes whenever a file is
+    added, removed or rewritten inside the bundle folder."""
+    count = size = newest = 0
+    for p in path.rglob("*"):
+        if p.is_file():
+            st = p.stat()
+            count += 1
+            size += st.st_size
+            newest = max(newest, st.st_mtime_ns)
+    return count, size, newest
+
+def bundle_targets(spec: FamilySpec, path: Path, metadata: Dict[str, Any]) -> list:
+    targets = metadata.get("target_variables")
+    if not targets:
+        targets = sorted(
+            p.name[len(spec.prefix): -len(spec.suffix)]
+            for p in path.glob(f"{spec.prefix}*{spec.suffix}")
+        )
+    return list(targets)
+
+def validate_bundle(spec: FamilySpec, path: Path) -> Dict[str, Any]:
+    """Check a folder without loading any model; returns the parsed metadata."""
+    missing = [f for f in spec.required if not (path / f).exists()]
+    if missing:
+        raise BundleError(f"missing {', '.join(missing)}")
+    try:
+        with open(path / "metadata.json") as f:
+            metadata = json.load(f)
+    except json.JSONDecodeError as e:
+        raise BundleError(f"metadata.json is not valid JSON: {e}")
+    targets = bundle_targets(spec, path, metadata)
+    if not any((path / f"{spec.prefix}{t}{spec.suffix}").exists() for t in targets):
+        raise BundleError(f"no {spec.prefix}*{spec.suffix} target models")
+    return metadata
+
+def load_bundle(spec: FamilySpec, model_id: str) -> ModelBundle:
+    path = spec.root / model_id
+    version = bundle_signature(path)
+    metadata = validate_bundle(spec, path)
+
+    documents = {}
+    for p in path.glob("*.json"):
+        if p.name != "metadata.json":
+            with open(p) as f:
+                documents[p.stem] = json.load(f)
+
+    models = {}
+    for t in bundle_targets(spec, path, metadata):
+        pth = path / f"{spec.prefix}{t}{spec.suffix}"
+        if pth.exists():
+            models[t] = spec.loader(pth)
+        else:
+            logger.warning(f"[catalog] {spec.name}/{model_id}: missing model for '{t}'")
+
+    scaler = joblib.load(path / "scaler.pkl")
+    label_encoders = joblib.load(path / "label_encoders.pkl")
+    sizer = spec.sizer or pickled_bytes
+    memory_bytes = sum(sizer(m) for m in models.values()) + pickled_bytes(scaler) + pickled_bytes(label_encoders)
+
+    return ModelBundle(
+        family=spec.name,
+        model_id=model_id,
+        path=path,
+        version=version,
+        metadata=metadata,
+        scaler=scaler,
+        label_encoders=label_encoders,
+        models=models,
+        targets=list(models),
+        documents=documents,
+        disk_bytes=version[1],
+        memory_bytes=memory_bytes,
+    )
+
+# ─────── Catalog ───────────
+class ModelCatalog:
+    """Registry of model bundles across all families.
+
+    A background thread polls each family folder. New or changed bundles are
+    validated and loaded off the request path once their contents have stopped
+    changing for one poll interval, then swapped in with a single dict
+    assignment so in-flight requests finish on the version they started with.
+    """
+
+    def __init__(self, poll_seconds: float = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._families: Dict[str, FamilySpec] = {}
+        self._bundles: Dict[Tuple[str, str], ModelBundle] = {}
+        self._status: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._seen: Dict[Tuple[str, str], Tuple[int, int, int]] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def register_family(
+        self,
+        name: str,
+        root: Path,
+        prefix: str,
+        suffix: str,
+        loader: Callable[[Path], Any],
+        required: Tuple[str, ...] = BASE_FILES,
+        release: Optional[Callable[[Any], None]] = None,
+        sizer: Optional[Callable[[Any], int]] = None,
+    ) -> None:
+        self._families[name] = FamilySpec(name, Path(root), prefix, suffix, loader, tuple(required), release, sizer)
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _release(self, spec: FamilySpec, bundle: Optional[ModelBundle]) -> None:
+        if bundle is None or spec.release is None:
+            return
+        try:
+            spec.release(bundle)
+        except Exception as e:
+            logger.warning(f"[catalog] {spec.name}/{bundle.model_id}: release failed: {e}")
+
+    def _set_status(self, key: Tuple[str, str], **fields) -> None:
+        with self._lock:
+            self._status[key] = {**self._status.get(key, {}), **fields}
+
+    def _load(self, spec: FamilySpec, model_id: str) -> ModelBundle:
+        key = (spec.name, model_id)
+        with self._key_lock(key):
+            current = self._bundles.get(key)
+            if current is not None and current.version == bundle_signature(current.path):
+                return current
+            self._set_status(key, status="loading", error=None)
+            started = time.perf_counter()
+            try:
+                bundle = load_bundle(spec, model_id)
+            except Exception as e:
+                self._set_status(key, status="invalid" if isinstance(e, BundleError) else "failed", error=str(e))
+                raise
+            self._bundles[key] = bundle  # atomic swap
+            self._release(spec, current)
+            self._set_status(
+                key,
+                status="ready",
+                error=None,
+                version=list(bundle.version),
+                targets=bundle.targets,
+                disk_bytes=bundle.disk_bytes,
+                memory_bytes=bundle.memory_bytes,
+                load_seconds=round(time.perf_counter() - started, 3),
+                loaded_at=bundle.loaded_at,
+            )
+            logger.info(f"[catalog] {spec.name}/{model_id} ready ({len(bundle.models)} targets)")
+            return bundle
+
+    def get(self, family: str, model_id: str) -> Optional[ModelBundle]:
+        """Return the current bundle, loading it on the spot on a cold miss.
+
+        Returns None when the folder does not exist; raises BundleError when it
+        exists but is incomplete."""
+        spec = self._families[family]
+        key = (family, model_id)
+        bundle = self._bundles.get(key)
+        if bundle is not None:
+            return bundle
+        if not (spec.root / model_id).is_dir():
+            return None
+        return self._load(spec, model_id)
+
+    @property
+    def families(self) -> list:
+        return list(self._families)
+
+    def spec(self, family: str) -> FamilySpec:
+        return self._families[family]
+
+    def scan(self, require_settled: bool = True) -> None:
+        """One poll over every family folder; schedules loads for settled changes.
+
+        With ``require_settled=False`` (startup) folders already on disk are
+        preloaded right away instead of waiting one interval."""
+        for spec in self._families.values():
+            present = set()
+            if spec.root.is_dir():
+                for path in spec.root.iterdir():
+                    if not path.is_dir() or path.name.startswith("."):
+                        continue
+                    key = (spec.name, path.name)
+                    present.add(key)
+                    sig = bundle_signature(path)
+                    settled = self._seen.get(key) == sig or not require_settled
+                    self._seen[key] = sig
+                    loaded = self._bundles.get(key)
+                    if loaded is not None and loaded.version == sig:
+                        continue
+                    if not settled:
+                        self._set_status(key, status="pending", error=None)
+                        continue
+                    if self._status.get(key, {}).get("status") in ("invalid", "failed") \
+                            and self._status[key].get("version") == list(sig):
+                        continue
+                    self._set_status(key, version=list(sig))
+                    self._submit(spec, path.name)
+            for key in [k for k in list(self._status) if k[0] == spec.name and k not in present]:
+                with self._lock:
+                    removed = self._bundles.pop(key, None)
+                    self._status.pop(key, None)
+                    self._seen.pop(key, None)
+                self._release(spec, removed)
+                logger.info(f"[catalog] {key[0]}/{key[1]} removed")
+
+    def _submit(self, spec: FamilySpec, model_id: str) -> None:
+        def job():
+            try:
+                self._load(spec, model_id)
+            except Exception as e:
+                logger.warning(f"[catalog] {spec.name}/{model_id} not loaded: {e}")
+        if self._pool is None:
+            job()
+        else:
+            self._pool.submit(job)
+
+    def _watch(self) -> None:
+        first = True
+        while not self._stop.is_set():
+            try:
+                self.scan(require_settled=not first)
+                first = False
+            except Exception as e:
+                logger.error(f"[catalog] scan failed: {e}", exc_info=True)
+            self._stop.wait(self.poll_seconds)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=PRELOAD_WORKERS, thread_name_prefix="catalog-preload")
+        self._thread = threading.Thread(target=self._watch, name="catalog-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def listing(self, family: Optional[str] = None) -> list:
+        with self._lock:
+            items = sorted(self._status.items())
+        return [
+            {"family": fam, "model_id": mid, **status}
+            for (fam, mid), status in items
+            if family is None or fam == family
+        ]
+
+catalog = ModelCatalog()
+
+# ─────── ENDPOINTS ───────
+@router.get("")
+def list_models() -> Dict[str, Any]:
+    return {"models": catalog.listing()}
+
+@router.get("/{family}")
+def list_family_models(family: str) -> Dict[str, Any]:
+    family = family.lower()
+    if family not in catalog.families:
+        raise HTTPException(404, f"Unknown model family '{family}'")
+    return {"family": family, "models": catalog.listing(family)}
@@ -0,0 +1,255 @@
+# app/changepoints.py
+
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from pydantic import BaseModel
+
+from app.memory import read_limited, parse_csv
+
+logger = logging.getLogger("app.changepoints")
+router = APIRouter(prefix="/api/changepoints", tags=["ChangePoints"])
+
+# ─────── CONFIG ───────
+MAX_WORKERS    = int(os.environ.get("CHANGEPOINT_WORKERS", str(os.cpu_count() or 1)))
+CACHE_SIZE     = int(os.environ.get("CHANGEPOINT_CACHE_SIZE", "4096"))
+POOL_MIN_ROWS  = 20_000     # below this, the process hop costs more than it saves
+DEFAULT_MIN_SIZE = 5
+
+# ─────── PELT ───────────
+def _noise_scale(x: np.ndarray) -> float:
+    """Robust noise σ from first differences, insensitive to the mean shifts."""
+    if len(x) < 3:
+        return 1.0
+    sigma = np.median(np.abs(np.diff(x))) / (0.6745 * np.sqrt(2))
+    if not sigma > 0:
+        sigma = float(np.std(x))
+    return float(sigma) if sigma > 0 else 1.0
+
+def pelt(x: np.ndarray, penalty: Optional[float] = None, min_size: int = DEFAULT_MIN_SIZE) -> List[int]:
+    """Mean-shift change points by PELT (Killick et al., 2012).
+
+    Segment cost is the Gaussian mean-shift cost on σ-normalised data,
+    evaluated in O(1) from cumulative sums of x and x². Candidates that can
+    no longer start an optimal last segment are pruned, which keeps the
+    expected running time linear in ``len(x)``. Returns the start index of
+    every segment after the first.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if n < 2 * min_size:
+        return []
+    x = (x - x.mean()) / _noise_scale(x)
+    if penalty is None:
+        penalty = 2.0 * np.log(n)  # BIC for one extra mean parameter
+
+    cs = np.concatenate(([0.0], np.cumsum(x)))
+    cs2 = np.concatenate(([0.0], np.cumsum(x * x)))
+
+    F = np.full(n + 1, np.inf)
+    F[0] = -penalty
+    last = np.zeros(n + 1, dtype=np.intp)
+
+    # Admissible candidates live in parallel buffers so each step is a few
+    # ufuncs over contiguous slices with no gathers. c_g holds F[s] - Σx²[:s];
+    # the Σx²[:t] term is the same for every s and is added after the argmin.
+    c_s = np.empty(n + 1)
+    c_1 = np.empty(n + 1)
+    c_g = np.empty(n + 1)
+    v = np.empty(n + 1)
+    w = np.empty(n + 1)
+    m = 0
+
+    for t in range(min_size, n + 1):
+        s_new = t - min_size  # becomes admissible once a min_size segment fits
+        if F[s_new] < np.inf:
+            c_s[m], c_1[m], c_g[m] = s_new, cs[s_new], F[s_new] - cs2[s_new]
+            m += 1
+        if m == 0:
+            continue
+        vm, wm = v[:m], w[:m]
+        np.subtract(cs[t], c_1[:m], out=vm)
+        np.multiply(vm, vm, out=vm)
+        np.subtract(t, c_s[:m], out=wm)
+        np.divide(vm, wm, out=vm)
+        np.subtract(c_g[:m], vm, out=vm)
+        i = int(vm.argmin())
+        best = vm[i]
+        F[t] = best + cs2[t] + penalty
+        last[t] = int(c_s[i])
+        # prune: s can never beat t as the last change point from here on.
+        # Stale candidates are harmless, so compact only once enough pile up.
+        np.less_equal(vm, best + penalty, out=wm)
+        kept = int(np.count_nonzero(wm))
+        if kept < 0.9 * m:
+            keep = np.flatnonzero(wm)
+            c_s[:kept], c_1[:kept], c_g[:kept] = c_s[keep], c_1[keep], c_g[keep]
+            m = kept
+
+    cps = []
+    t = last[n]
+    while t > 0:
+        cps.append(int(t))
+        t = last[t]
+    return cps[::-1]
+
+def segment_series(x: np.ndarray, penalty: Optional[float], min_size: int) -> Dict[str, Any]:
+    x = np.asarray(x, dtype=np.float64)
+    cps = pelt(x, penalty, min_size)
+    bounds = [0, *cps, len(x)]
+    return {
+        "changepoints": cps,
+        "segments": [
+            {"start": a, "end": b, "mean": float(x[a:b].mean())}
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ],
+    }
+
+# ─────── Cache & pool ───────────
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def series_key(x: np.ndarray, penalty: Optional[float], min_size: int) -> str:
+    h = hashlib.blake2b(np.ascontiguousarray(x, dtype=np.float64).tobytes(), digest_size=16)
+    h.update(f"|{penalty}|{min_size}".encode())
+    return h.hexdigest()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent already runs TensorFlow threads
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def detect_changepoints(
+    values: np.ndarray,
+    entity_ids: Optional[np.ndarray] = None,
+    penalty: Optional[float] = None,
+    min_size: int = DEFAULT_MIN_SIZE,
+) -> Dict[str, Any]:
+    """Segment every entity's series, reusing cached results by content hash.
+
+    Change points and segment bounds are returned as row indices of
+    ``values``; uncached entities are fanned out across the process pool.
+    Rows without an entity id are left out and counted in
+    ``n_without_entity``."""
+    if min_size < 1:
+        raise ValueError("min_size must be at least 1")
+    values = np.asarray(values, dtype=np.float64)
+    if entity_ids is None:
+        entity_ids = np.zeros(len(values), dtype=np.int64)
+    entity_ids = np.asarray(entity_ids)
+    finite = np.isfinite(values)
+
+    codes, uniques = pd.factorize(entity_ids)   # missing ids get code -1
+    order = np.argsort(codes, kind="stable")
+    order = order[finite[order] & (codes[order] >= 0)]
+    splits = np.flatnonzero(np.diff(codes[order])) + 1
+    rows_by_entity = {uniques[codes[g[0]]]: g for g in np.split(order, splits) if len(g)}
+
+    keys = {ent: series_key(values[rows], penalty, min_size) for ent, rows in rows_by_entity.items()}
+    with _cache_lock:
+        found = {ent: _cache[k] for ent, k in keys.items() if k in _cache}
+        for k in keys.values():
+            if k in _cache:
+                _cache.move_to_end(k)
+
+    missing = [ent for ent in rows_by_entity if ent not in found]
+    if missing:
+        series = [values[rows_by_entity[ent]] for ent in missing]
+        total = sum(len(s) for s in series)
+        if len(missing) > 1 and total >= POOL_MIN_ROWS and MAX_WORKERS > 1:
+            pool = _get_pool()
+            computed = list(pool.map(
+                segment_series, series,
+                [penalty] * len(series), [min_size] * len(series),
+                chunksize=max(1, len(series) // (4 * MAX_WORKERS)),
+            ))
+        else:
+            computed = [segment_series(s, penalty, min_size) for s in series]
+        with _cache_lock:
+            for ent, res in zip(missing, computed):
+                found[ent] = res
+                _cache[keys[ent]] = res
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    entities = {}
+    for ent, rows in rows_by_entity.items():
+        res = found[ent]
+        # row indices into ``values``; segment ends are inclusive
+        entities[str(ent)] = {
+            "n": int(len(rows)),
+            "changepoints": rows[res["changepoints"]].tolist(),
+            "segments": [
+                {"start": int(rows[s["start"]]), "end": int(rows[s["end"] - 1]), "mean": s["mean"]}
+                for s in res["segments"]
+            ],
+        }
+    return {
+        "penalty": penalty,
+        "min_size": min_size,
+        "n_without_entity": int((codes < 0).sum()),
+        "entities": entities,
+    }
+
+# ─────── ENDPOINTS ───────
+class SeriesRequest(BaseModel):
+    values: List[Optional[float]]
+    entity_ids: Optional[List[int | str]] = None
+    penalty: Optional[float] = None
+    min_size: int = DEFAULT_MIN_SIZE
+
+@router.post("/series")
+def changepoints_for_series(req: SeriesRequest) -> Dict[str, Any]:
+    """Segment a series posted as JSON, e.g. a predict response's predictions."""
+    if req.entity_ids is not None and len(req.entity_ids) != len(req.values):
+        raise HTTPException(400, "entity_ids must match values in length")
+    if req.min_size < 1:
+        raise HTTPException(400, "min_size must be at least 1")
+    values = np.array([np.nan if v is None else v for v in req.values], dtype=np.float64)
+    entity_ids = np.array(req.entity_ids) if req.entity_ids is not None else None
+    return detect_changepoints(values, entity_ids, req.penalty, req.min_size)
+
+@router.post("/upload")
+def changepoints_for_upload(
+    file: UploadFile = File(...),
+    column: str = "d18O_measurement",
+    entity_column: str = "entity_id",
+    penalty: float | None = None,
+    min_size: int = DEFAULT_MIN_SIZE,
+) -> Dict[str, Any]:
+    """Segment one column of an uploaded CSV, per cave entity."""
+    if min_size < 1:
+        raise HTTPException(400, "min_size must be at least 1")
+    df = parse_csv(read_limited(file))
+    if column not in df.columns:
+        raise HTTPException(400, f"Column '{column}' not in upload")
+
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+    entity_ids = df[entity_column].to_numpy() if entity_column in df.columns else None
+    result = detect_changepoints(values, entity_ids, penalty, min_size)
+    logger.info(f"[changepoints] {len(result['entities'])} entities segmented on '{column}'")
+    return {"column": column, **result}
@@ -0,0 +1,168 @@
+# app/datasets.py
+
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from fastapi import APIRouter, UploadFile, File, HTTPException
+
+from app.memory import check_upload_bytes, read_limited, parse_csv
+from app.catalog import catalog
+from app.agemodel import AGE_COLUMNS, DEPTH_COLUMNS
+
+logger = logging.getLogger("app.datasets")
+router = APIRouter(prefix="/api/datasets", tags=["Datasets"])
+
+# ─────── CONFIG ───────
+DATASET_DIR = Path(os.environ.get("DATASET_DIR", Path(tempfile.gettempdir()) / "sisal-datasets"))
+TTL_SECONDS = int(os.environ.get("DATASET_TTL_SECONDS", "3600"))   # idle time before eviction
+# Arrow IPC buffer compression ("uncompressed", "lz4" or "zstd"). Uncompressed
+# columns are read zero-copy from the memory map; compressed files are
+# smaller on disk but every column read is decompressed into fresh memory.
+COMPRESSION = os.environ.get("DATASET_COMPRESSION", "uncompressed")
+SUFFIX      = ".arrow"
+ID_COLUMNS  = ("sample_id", "site_id", "entity_id", "site_name")
+
+_write_lock = threading.Lock()
+
+# ─────── Helpers ───────────
+def dataset_id_for(contents: bytes) -> str:
+    return hashlib.blake2b(contents, digest_size=16).hexdigest()
+
+def _path(dataset_id: str) -> Path:
+    # ids are hex digests; anything else never reaches the filesystem
+    if len(dataset_id) != 32 or any(c not in "0123456789abcdef" for c in dataset_id):
+        raise HTTPException(400, f"Invalid dataset_id '{dataset_id}'")
+    return DATASET_DIR / f"{dataset_id}{SUFFIX}"
+
+def _describe(path: Path) -> Dict[str, Any]:
+    with pa.memory_map(str(path)) as source:
+        schema = pa.ipc.open_file(source).schema
+    n_rows = int(schema.metadata[b"n_rows"])
+    stat = path.stat()
+    return {
+        "dataset_id": path.stem,
+        "n_rows": n_rows,
+        "columns": schema.names,
+        "size_bytes": stat.st_size,
+        "expires_at": stat.st_mtime + TTL_SECONDS,
+    }
+
+def evict_expired(now: Optional[float] = None) -> List[str]:
+    """Delete datasets nobody has read for TTL_SECONDS."""
+    now = time.time() if now is None else now
+    evicted = []
+    for path in DATASET_DIR.glob(f"*{SUFFIX}") if DATASET_DIR.is_dir() else []:
+        try:
+            if now - path.stat().st_mtime > TTL_SECONDS:
+                path.unlink()
+                evicted.append(path.stem)
+        except FileNotFoundError:
+            continue
+    if evicted:
+        logger.info(f"[datasets] evicted {len(evicted)} expired dataset(s)")
+    return evicted
+
+def register_dataset(contents: bytes) -> Dict[str, Any]:
+    """Parse a CSV upload once and store it as an Arrow file keyed by its
+    content hash. Re-uploading the same bytes only refreshes the TTL."""
+    check_upload_bytes(len(contents))
+    dataset_id = dataset_id_for(contents)
+    path = _path(dataset_id)
+    evict_expired()
+    if path.exists():
+        os.utime(path)
+        return {**_describe(path), "created": False}
+
+    df = parse_csv(contents)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"n_rows": str(len(df)).encode()})
+    options = pa.ipc.IpcWriteOptions(compression=None if COMPRESSION == "uncompressed" else COMPRESSION)
+    with _write_lock:
+        DATASET_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = DATASET_DIR / f".{dataset_id}.tmp"
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    logger.info(f"[datasets] stored {dataset_id}: {len(df)} rows × {len(df.columns)} cols")
+    return {**_describe(path), "created": True}
+
+def load_dataset(dataset_id: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a stored dataset through a memory map. With ``columns`` only those
+    columns' buffers are read, and only they are converted to pandas; the
+    rest of the file is never paged in. Names missing from the dataset are
+    ignored. Each read pushes the expiry back by TTL_SECONDS."""
+    path = _path(dataset_id)
+    try:
+        os.utime(path)
+        if columns is not None:
+            with pa.memory_map(str(path)) as source:
+                names = pa.ipc.open_file(source).schema.names   # footer only
+            columns = [c for c in names if c in set(columns)]
+        return feather.read_table(str(path), columns=columns, memory_map=True).to_pandas()
+    except FileNotFoundError:
+        raise HTTPException(404, f"Dataset '{dataset_id}' not found or expired")
+
+def bundle_columns(family: str, model_id: str) -> Optional[List[str]]:
+    """Columns a predict call with this bundle reads: the scaler's inputs, the
+    label-encoded columns, the targets, the id columns and the age/depth
+    columns of the time axis. None (read everything) when the scaler does
+    not record its feature names or the bundle cannot be loaded."""
+    try:
+        bundle = catalog.get(family, model_id)
+    except Exception:
+        return None
+    features = getattr(getattr(bundle, "scaler", None), "feature_names_in_", None)
+    if features is None:
+        return None
+    return list(dict.fromkeys([
+        *features, *bundle.label_encoders, *bundle.targets, *ID_COLUMNS, *AGE_COLUMNS, *DEPTH_COLUMNS
+    ]))
+
+async def read_upload(
+    file: Optional[UploadFile], dataset_id: Optional[str], columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """DataFrame for a predict call: a registered dataset when ``dataset_id``
+    is given (only ``columns`` of it, if set), otherwise the multipart CSV
+    upload."""
+    if dataset_id:
+        return load_dataset(dataset_id, columns)
+    if file is None:
+        raise HTTPException(400, "Send a CSV file or a dataset_id")
+    return parse_csv(read_limited(file))
+
+# ─────── ENDPOINTS ───────
+@router.post("")
+def upload_dataset(file: UploadFile = File(...)) -> Dict[str, Any]:
+    return register_dataset(read_limited(file))
+
+@router.get("")
+def list_datasets() -> Dict[str, Any]:
+    evict_expired()
+    paths = sorted(DATASET_DIR.glob(f"*{SUFFIX}")) if DATASET_DIR.is_dir() else []
+    return {"ttl_seconds": TTL_SECONDS, "datasets": [_describe(p) for p in paths]}
+
+@router.get("/{dataset_id}")
+def get_dataset(dataset_id: str) -> Dict[str, Any]:
+    path = _path(dataset_id)
+    if not path.exists():
+        raise HTTPException(404, f"Dataset '{dataset_id}' not found or expired")
+    return _describe(path)
+
+@router.delete("/{dataset_id}")
+def delete_dataset(dataset_id: str) -> Dict[str, Any]:
+    path = _path(dataset_id)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        raise HTTPException(404, f"Dataset '{dataset_id}' not found or expired")
+    return {"dataset_id": dataset_id, "deleted": True}
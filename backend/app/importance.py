@@ -0,0 +1,214 @@
+# app/importance.py
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.metrics import r2_score
+
+from app.catalog import catalog, ModelBundle
+from app.memory import read_limited, parse_csv
+
+logger = logging.getLogger("app.importance")
+router = APIRouter(prefix="/api/importance", tags=["FeatureImportance"])
+
+# ─────── CONFIG ───────
+MAX_WORKERS      = int(os.environ.get("IMPORTANCE_WORKERS", str(os.cpu_count() or 1)))
+CACHE_SIZE       = int(os.environ.get("IMPORTANCE_CACHE_SIZE", "256"))
+DEFAULT_REPEATS  = 5
+MAX_REPEATS      = int(os.environ.get("IMPORTANCE_MAX_REPEATS", "50"))   # each repeat predicts once per feature
+DEFAULT_MAX_ROWS = 20_000
+SEQUENCE_FAMILIES = ("bilstm", "transformer")
+DROP_COLS = ["sample_id", "site_id", "entity_id", "site_name"]
+TARGET_VARIABLES = [
+    "d18O_measurement",
+    "d13C_measurement",
+    "Mg_Ca_measurement",
+    "Sr_Ca_measurement",
+]
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="importance")
+_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# ─────── Helpers ───────────
+def preprocess(df: pd.DataFrame, bundle: ModelBundle) -> pd.DataFrame:
+    """Same preprocessing the predict routers apply before inference."""
+    df_proc = df.drop(columns=[c for c in DROP_COLS if c in df.columns], errors="ignore")
+    num_cols = df_proc.select_dtypes(include=["float64", "int64"]).columns
+    df_proc[num_cols] = df_proc[num_cols].fillna(df_proc[num_cols].median())
+    for col, le in bundle.label_encoders.items():
+        if col in df_proc:
+            df_proc[col] = le.transform(df_proc[col].astype(str))
+    df_proc[num_cols] = bundle.scaler.transform(df_proc[num_cols])
+    return df_proc
+
+def time_steps_for(bundle: ModelBundle) -> int:
+    md = bundle.metadata
+    return md.get("time_steps") or md.get("model_config", {}).get("time_steps") or 10
+
+def make_windows(X: np.ndarray, time_steps: int) -> np.ndarray:
+    """Vectorised ``create_sequences``: window i is rows [i, i + time_steps)."""
+    return sliding_window_view(X, time_steps, axis=0)[:-1].transpose(0, 2, 1)
+
+def predict_all(bundle: ModelBundle, X: np.ndarray, columns: List[str], targets: List[str]) -> Dict[str, np.ndarray]:
+    if bundle.family in SEQUENCE_FAMILIES:
+        X_seq = make_windows(X, time_steps_for(bundle))
+        return {t: bundle.models[t].predict(X_seq, verbose=0).flatten() for t in targets}
+    frame = pd.DataFrame(X, columns=columns, copy=False)
+    return {t: np.asarray(bundle.models[t].predict(frame)) for t in targets}
+
+def native_importance(bundle: ModelBundle, X: pd.DataFrame, targets: List[str]) -> Dict[str, Dict[str, float]]:
+    """XGBoost: mean |SHAP contribution| via ``pred_contribs``; sklearn trees:
+    impurity importances. Families without a native measure return {}."""
+    out = {}
+    for t in targets:
+        model = bundle.models[t]
+        if bundle.family == "xgboost" and hasattr(model, "get_booster"):
+            import xgboost as xgb
+            contribs = model.get_booster().predict(xgb.DMatrix(X), pred_contribs=True)
+            values = np.abs(contribs[:, :-1]).mean(axis=0)  # last column is the bias
+        elif hasattr(model, "feature_importances_"):
+            values = np.asarray(model.feature_importances_)
+        else:
+            continue
+        out[t] = {f: float(v) for f, v in zip(X.columns, values)}
+    return out
+
+def permutation_importance(
+    bundle: ModelBundle,
+    X: np.ndarray,
+    columns: List[str],
+    y: Dict[str, np.ndarray],
+    n_repeats: int,
+    seed: int,
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Drop in R² when one feature column is shuffled.
+
+    Every (feature, repeat) pair is an independent task on the worker pool;
+    each task predicts all targets on its shuffled copy so the permutation
+    and copy are paid once per pair, not once per target."""
+    targets = list(y)
+    baseline = {t: r2_score(y[t], p) for t, p in predict_all(bundle, X, columns, targets).items()}
+    seeds = np.random.SeedSequence(seed).spawn(len(columns) * n_repeats)
+
+    def task(j: int, r: int) -> Dict[str, float]:
+        rng = np.random.default_rng(seeds[j * n_repeats + r])
+        Xp = X.copy()
+        Xp[:, j] = Xp[rng.permutation(len(Xp)), j]
+        preds = predict_all(bundle, Xp, columns, targets)
+        return {t: baseline[t] - r2_score(y[t], preds[t]) for t in targets}
+
+    futures = {
+        (j, r): _pool.submit(task, j, r)
+        for j in range(len(columns)) for r in range(n_repeats)
+    }
+    drops = {t: np.empty((len(columns), n_repeats)) for t in targets}
+    for (j, r), fut in futures.items():
+        for t, d in fut.result().items():
+            drops[t][j, r] = d
+
+    return {
+        t: {
+            f: {"mean": float(drops[t][j].mean()), "std": float(drops[t][j].std())}
+            for j, f in enumerate(columns)
+        }
+        for t in targets
+    }
+
+def compute_importance(
+    family: str,
+    model_id: str,
+    contents: bytes,
+    n_repeats: int = DEFAULT_REPEATS,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    bundle = catalog.get(family, model_id)
+    if bundle is None:
+        raise HTTPException(404, f"Model '{model_id}' not found")
+    # R² needs two scored samples; a sequence model loses its first time_steps rows
+    min_rows = time_steps_for(bundle) + 2 if family in SEQUENCE_FAMILIES else 2
+    if max_rows < min_rows:
+        raise HTTPException(400, f"max_rows must be at least {min_rows} for {family}")
+
+    digest = hashlib.blake2b(contents, digest_size=16).hexdigest()
+    key = (family, model_id, bundle.version, digest, n_repeats, max_rows, seed)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    df = parse_csv(contents)
+    if len(df) < min_rows:
+        raise HTTPException(400, f"Upload needs at least {min_rows} rows for {family}")
+    if len(df) > max_rows:
+        # a contiguous block keeps sequence windows meaningful
+        start = np.random.default_rng(seed).integers(0, len(df) - max_rows + 1)
+        df = df.iloc[start : start + max_rows].reset_index(drop=True)
+
+    df_proc = preprocess(df, bundle)
+    targets = [t for t in bundle.targets if t in df_proc]
+    if not targets:
+        raise HTTPException(400, "Upload contains none of the model's target columns")
+    X = df_proc.drop(columns=[*TARGET_VARIABLES, *bundle.targets], errors="ignore")
+    columns = list(X.columns)
+    Xv = X.to_numpy(dtype=np.float64)
+
+    if family in SEQUENCE_FAMILIES:
+        ts = time_steps_for(bundle)
+        y = {t: df_proc[t].to_numpy()[ts:] for t in targets}
+    else:
+        y = {t: df_proc[t].to_numpy() for t in targets}
+
+    permutation = permutation_importance(bundle, Xv, columns, y, n_repeats, seed)
+    result = {
+        "family": family,
+        "model_id": model_id,
+        "n_rows": int(len(df)),
+        "n_repeats": n_repeats,
+        "features": columns,
+        # same {target: {feature: value}} shape as /feature-importance/{model}
+        "importance": {t: {f: v["mean"] for f, v in imp.items()} for t, imp in permutation.items()},
+        "permutation": permutation,
+        "native": native_importance(bundle, X, targets),
+    }
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+# ─────── ENDPOINT ───────
+@router.post("/{family}")
+def feature_importance_for_upload(
+    family: str,
+    file: UploadFile = File(...),
+    model_id: str | None = None,
+    n_repeats: int = DEFAULT_REPEATS,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    family = family.lower()
+    if family not in catalog.families:
+        raise HTTPException(404, f"Unknown model family '{family}'")
+    if not 1 <= n_repeats <= MAX_REPEATS:
+        raise HTTPException(400, f"n_repeats must be between 1 and {MAX_REPEATS}")
+    model_id = model_id or f"pretrained_{family}"
+    try:
+        result = compute_importance(family, model_id, read_limited(file), n_repeats, max_rows, seed)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[importance] {family}/{model_id} failed: {e}", exc_info=True)
+        raise HTTPException(400, f"Error computing importance: {e}")
+    logger.info(f"[importance] {family}/{model_id}: {len(result['features'])} features × {n_repeats} repeats")
+    return result
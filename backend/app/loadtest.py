@@ -0,0 +1,307 @@
+# app/loadtest.py
+"""Load generator for the analysis API (run from backend/).
+
+    python -m app.loadtest --csv sample.csv --rate 20 --duration 30
+    python -m app.loadtest --csv sample.csv --server uvicorn --workers 4
+    python -m app.loadtest --csv sample.csv --url http://localhost:8000
+
+Requests are sent open-loop at ``--rate`` per second, so a slow response
+never delays the next send. Latency is measured from each request's
+scheduled start; time spent queued in the server therefore shows up in
+the percentiles instead of quietly lowering the offered load.
+"""
+
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+import httpx
+import numpy as np
+import psutil
+
+# ─────── CONFIG ───────
+DEFAULT_MIX = (
+    "predict:rf=2,predict:xgboost=2,predict:bilstm=1,predict:transformer=1,"
+    "get:/metrics/xgboost=2,get:/predictions/xgboost=2,get:/anomalies/xgboost=1,get:/api/models=1"
+)
+RSS_SAMPLE_SECONDS = 0.25
+STARTUP_TIMEOUT    = 180       # seconds to wait for uvicorn workers to load models
+
+# ─────── Mix ───────────
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    weight: float
+
+def parse_mix(spec: str) -> List[Endpoint]:
+    """``predict:<family>=w`` posts the CSV to /api/analyze/<family>/predict;
+    ``get:<path>=w`` is a dashboard GET. Weights are relative."""
+    endpoints = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        key, _, weight = item.partition("=")
+        kind, _, target = key.partition(":")
+        if kind == "predict":
+            path = f"/api/analyze/{target}/predict"
+            endpoints.append(Endpoint(f"POST {path}", "POST", path, float(weight or 1)))
+        elif kind == "get":
+            endpoints.append(Endpoint(f"GET {target}", "GET", target, float(weight or 1)))
+        else:
+            raise ValueError(f"mix entry '{item}' must start with predict: or get:")
+    return endpoints
+
+# ─────── Measurement ───────────
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+    rss: List[int] = field(default_factory=list)   # worker RSS when each request finished
+
+class RssSampler:
+    """Polls the resident set size of the server's worker processes; a
+    sampler without a root process (remote server, no pid) reports nothing.
+
+    The root and all its descendants are counted, since a single-process
+    server may still spawn helpers. Only a ``supervisor`` root (uvicorn
+    --workers N > 1, which serves nothing itself) is left out."""
+
+    def __init__(self, root: Optional[psutil.Process], supervisor: bool = False):
+        self.root = root
+        self.supervisor = supervisor
+        self.current = 0
+        self.peak: Dict[int, int] = {}
+
+    def workers(self) -> List[psutil.Process]:
+        try:
+            children = self.root.children(recursive=True)
+        except psutil.Error:
+            children = []
+        return children if self.supervisor else [self.root, *children]
+
+    def sample(self) -> int:
+        total = 0
+        for p in self.workers():
+            try:
+                rss = p.memory_info().rss
+            except psutil.Error:
+                continue
+            total += rss
+            self.peak[p.pid] = max(self.peak.get(p.pid, 0), rss)
+        self.current = total
+        return total
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while self.root is not None and not stop.is_set():
+            self.sample()
+            try:
+                await asyncio.wait_for(stop.wait(), RSS_SAMPLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+async def run_load(
+    client: httpx.AsyncClient,
+    endpoints: List[Endpoint],
+    upload: Dict[str, Any],
+    rate: float,
+    duration: float,
+    concurrency: int,
+    sampler: RssSampler,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    weights = [e.weight for e in endpoints]
+    stats = {e.name: EndpointStats() for e in endpoints}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(ep: Endpoint, scheduled: float) -> None:
+        s = stats[ep.name]
+        async with gate:
+            try:
+                if ep.method == "POST":
+                    r = await client.post(ep.path, **upload)
+                else:
+                    r = await client.get(ep.path)
+                s.statuses[r.status_code] += 1
+                ok = r.status_code < 400
+            except httpx.HTTPError as e:
+                s.statuses[type(e).__name__] += 1
+                ok = False
+        s.latencies.append(loop.time() - scheduled)
+        s.errors += not ok
+        s.rss.append(sampler.current)
+
+    stop = asyncio.Event()
+    sampling = asyncio.create_task(sampler.run(stop))
+    tasks = []
+    start = loop.time()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        ep = rng.choices(endpoints, weights)[0]
+        tasks.append(asyncio.create_task(one(ep, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    stop.set()
+    await sampling
+    return summarize(stats, elapsed, sampler)
+
+def _percentiles(latencies: List[float]) -> Dict[str, Optional[float]]:
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2), "max_ms": round(ms.max(), 2)}
+
+def summarize(stats: Dict[str, EndpointStats], elapsed: float, sampler: RssSampler) -> Dict[str, Any]:
+    mb = 1024 * 1024
+    report = {"elapsed_s": round(elapsed, 3), "endpoints": {}}
+    for name, s in stats.items():
+        n = len(s.latencies)
+        report["endpoints"][name] = {
+            "requests": n,
+            "throughput_rps": round(n / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(s.errors / n, 4) if n else 0.0,
+            **_percentiles(s.latencies),
+            "rss_mb_mean": round(float(np.mean(s.rss)) / mb, 1) if sampler.root and s.rss else None,
+            "rss_mb_max": round(max(s.rss) / mb, 1) if sampler.root and s.rss else None,
+            "statuses": {str(k): v for k, v in s.statuses.items()},
+        }
+    all_lat = [x for s in stats.values() for x in s.latencies]
+    n_errors = sum(s.errors for s in stats.values())
+    report["total"] = {
+        "requests": len(all_lat),
+        "throughput_rps": round(len(all_lat) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(n_errors / len(all_lat), 4) if all_lat else 0.0,
+        **_percentiles(all_lat),
+    }
+    report["workers"] = {str(pid): round(rss / mb, 1) for pid, rss in sampler.peak.items()}
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    cols = ("requests", "throughput_rps", "error_rate", "p50_ms", "p95_ms", "p99_ms", "rss_mb_max")
+    heads = ("n", "rps", "err", "p50 ms", "p95 ms", "p99 ms", "rss MB")
+    width = max(len(n) for n in [*report["endpoints"], "total"])
+    print(f"{'endpoint':<{width}}  " + "  ".join(f"{h:>9}" for h in heads))
+    rows = [*report["endpoints"].items(), ("total", report["total"])]
+    for name, row in rows:
+        print(f"{name:<{width}}  " + "  ".join(f"{'-' if row.get(c) is None else row[c]:>9}" for c in cols))
+    print(f"\nelapsed {report['elapsed_s']}s; peak worker RSS (MB): {report['workers']}")
+
+# ─────── Servers ───────────
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@asynccontextmanager
+async def in_process_server():
+    """The app on an ASGI transport in this process, lifespan included.
+
+    Client and server share one event loop and GIL, so absolute numbers
+    are pessimistic; use it to compare code changes, not to size workers."""
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        yield "http://loadtest", transport, psutil.Process()
+
+@asynccontextmanager
+async def uvicorn_server(workers: int):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers)],
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        async with httpx.AsyncClient(base_url=url) as probe:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+                try:
+                    if (await probe.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"uvicorn not ready after {STARTUP_TIMEOUT}s")
+                await asyncio.sleep(0.5)
+        yield url, None, psutil.Process(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+@asynccontextmanager
+async def external_server(url: str, pid: Optional[int]):
+    # RSS is only reported when the server's pid is given
+    yield url, None, psutil.Process(pid) if pid else None
+
+# ─────── CLI ───────────
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    endpoints = parse_mix(args.mix)
+    contents = Path(args.csv).read_bytes()
+    if args.url:
+        server = external_server(args.url, args.pid)
+    elif args.server == "uvicorn":
+        server = uvicorn_server(args.workers)
+    else:
+        server = in_process_server()
+
+    async with server as (url, transport, root):
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, transport=transport, timeout=args.timeout, limits=limits) as client:
+            if args.dataset:
+                r = await client.post("/api/datasets", files={"file": (Path(args.csv).name, contents, "text/csv")})
+                r.raise_for_status()
+                upload = {"params": {"dataset_id": r.json()["dataset_id"]}}
+            else:
+                upload = {"files": {"file": (Path(args.csv).name, contents, "text/csv")}}
+            # in-process and single-worker servers handle requests in the root itself
+            sampler = RssSampler(root, supervisor=bool(args.url or args.server == "uvicorn") and args.workers > 1)
+            report = await run_load(
+                client, endpoints, upload, args.rate, args.duration, args.concurrency, sampler, args.seed
+            )
+    report["config"] = vars(args)
+    return report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Replay a predict/dashboard mix against the API.")
+    p.add_argument("--csv", required=True, help="CSV sent to the predict endpoints")
+    p.add_argument("--mix", default=DEFAULT_MIX, help="comma-separated predict:<family>=w / get:<path>=w")
+    p.add_argument("--rate", type=float, default=10.0, help="requests per second")
+    p.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    p.add_argument("--concurrency", type=int, default=256, help="max requests in flight")
+    p.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    p.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (with --url: how many the target runs)")
+    p.add_argument("--url", help="target an already running server instead")
+    p.add_argument("--pid", type=int, help="pid of the --url server, for RSS")
+    p.add_argument("--dataset", action="store_true", help="register the CSV once and send dataset_id")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", help="also write the report to this file")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
@@ -16,7 +16,7 @@ import absl.logging
 absl.logging.set_verbosity(absl.logging.ERROR)
 absl.logging.set_stderrthreshold('error')
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import pandas as pd
@@ -25,11 +25,24 @@ import os
 import joblib
 import logging
 from typing import Optional
+from contextlib import asynccontextmanager
 from tensorflow.keras.models import load_model
 from app import randomforest, xgboost, transformer, bilstm  # Added bilstm module import
+from app import catalog, changepoints, importance, training, agemodel, sites, datasets, memory
 import warnings
 from sklearn.exceptions import InconsistentVersionWarning
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    memory.start_tracing()
+    # Preload every bundle on disk and keep watching for new ones
+    catalog.catalog.start()
+    yield
+    catalog.catalog.stop()
+    changepoints.shutdown_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,8 +53,27 @@ app.include_router(randomforest.router)
 app.include_router(xgboost.router)
 app.include_router(transformer.router)
 app.include_router(bilstm.router)  # Added BiLSTM router
+app.include_router(catalog.router)
+app.include_router(changepoints.router)
+app.include_router(importance.router)
+app.include_router(training.router)
+app.include_router(agemodel.router)
+app.include_router(sites.router)
+app.include_router(datasets.router)
 warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
 
+# Reject oversized bodies before they are read; registered before CORS so
+# the 413 still carries CORS headers for the browser
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > memory.MAX_UPLOAD_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds {memory.MAX_UPLOAD_BYTES // memory.MB} MB"},
+        )
+    return await call_next(request)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
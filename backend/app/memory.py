@@ -0,0 +1,142 @@
+# app/memory.py
+
+import os
+import gc
+import logging
+import tracemalloc
+from io import BytesIO
+from typing import Dict, Any, List
+
+import numpy as np
+import psutil
+import pandas as pd
+import matplotlib.pyplot as plt
+from fastapi import HTTPException, UploadFile
+
+logger = logging.getLogger("app.memory")
+
+# ─────── CONFIG ───────
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+MAX_UPLOAD_ROWS  = int(os.environ.get("MAX_UPLOAD_ROWS", "1000000"))
+TRACEMALLOC      = os.environ.get("MEMORY_TRACEMALLOC", "0") == "1"   # adds Python-heap stats, costs speed
+MB = 1024 * 1024
+
+_process = psutil.Process()
+
+# ─────── Accounting ───────────
+def rss_bytes() -> int:
+    return _process.memory_info().rss
+
+def start_tracing() -> None:
+    if TRACEMALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        logger.info("[memory] tracemalloc enabled")
+
+class MemoryProfile:
+    """Memory deltas between named checkpoints of one request.
+
+    ``mark(stage)`` closes the stage that started at the previous mark and
+    records the worker's RSS change; with MEMORY_TRACEMALLOC=1 it also records
+    the Python-heap change and the heap peak reached inside the stage. Both
+    are process-wide, so concurrent requests in one worker blur each other.
+    """
+
+    def __init__(self):
+        self.start_rss = self._last_rss = rss_bytes()
+        self.stages: List[Dict[str, Any]] = []
+        if tracemalloc.is_tracing():
+            self._last_heap = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def mark(self, stage: str) -> None:
+        rss = rss_bytes()
+        entry = {
+            "stage": stage,
+            "rss_mb": round(rss / MB, 1),
+            "rss_delta_mb": round((rss - self._last_rss) / MB, 2),
+        }
+        self._last_rss = rss
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            entry["heap_delta_mb"] = round((current - self._last_heap) / MB, 2)
+            entry["heap_peak_mb"] = round((peak - self._last_heap) / MB, 2)
+            self._last_heap = current
+            tracemalloc.reset_peak()
+        self.stages.append(entry)
+
+    def report(self) -> Dict[str, Any]:
+        rss = rss_bytes()
+        return {
+            "rss_start_mb": round(self.start_rss / MB, 1),
+            "rss_end_mb": round(rss / MB, 1),
+            "rss_delta_mb": round((rss - self.start_rss) / MB, 2),
+            "tracemalloc": tracemalloc.is_tracing(),
+            "stages": self.stages,
+        }
+
+# ─────── Limits ───────────
+def check_upload_bytes(n_bytes: int) -> None:
+    if n_bytes > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            413, f"Upload is {n_bytes / MB:.1f} MB; the limit is {MAX_UPLOAD_BYTES / MB:.0f} MB"
+        )
+
+def check_upload_rows(n_rows: int) -> None:
+    if n_rows > MAX_UPLOAD_ROWS:
+        raise HTTPException(413, f"Upload has more than {MAX_UPLOAD_ROWS} rows")
+
+def read_limited(file: UploadFile) -> bytes:
+    """Upload body, read at most one byte past MAX_UPLOAD_BYTES."""
+    if file.size is not None:
+        check_upload_bytes(file.size)
+    try:
+        contents = file.file.read(MAX_UPLOAD_BYTES + 1)
+    finally:
+        file.file.close()   # drop the spooled temp copy right away
+    check_upload_bytes(len(contents))
+    return contents
+
+def parse_csv(contents: bytes) -> pd.DataFrame:
+    """Parse an upload, stopping one row past MAX_UPLOAD_ROWS so an oversized
+    file is rejected with 413 before it is fully materialised."""
+    try:
+        df = pd.read_csv(BytesIO(contents), nrows=MAX_UPLOAD_ROWS + 1)
+    except Exception:
+        raise HTTPException(400, "Uploaded file is not a valid CSV")
+    check_upload_rows(len(df))
+    if df.empty:
+        raise HTTPException(400, "Uploaded file is empty")
+    return df
+
+# ─────── Guards ───────────
+async def figure_guard():
+    """Route dependency that closes any pyplot figure a request leaves open,
+    e.g. when plotting raises before ``plot_to_base64`` closes it.
+
+    Async on purpose: it runs on the event loop like the predict handlers,
+    which plot without awaiting, so no other request has figures open
+    between the snapshot and the cleanup."""
+    before = set(plt.get_fignums())
+    try:
+        yield
+    finally:
+        leaked = set(plt.get_fignums()) - before
+        for num in leaked:
+            plt.close(num)
+        if leaked:
+            logger.warning(f"[memory] closed {len(leaked)} figure(s) left open by a request")
+
+def keras_model_bytes(model) -> int:
+    """Catalog size hook for Keras families: bytes held by the model's
+    weights (parameter count × dtype size), without serialising it."""
+    return sum(int(np.prod(w.shape)) * np.dtype(w.dtype).itemsize for w in model.weights)
+
+def release_keras(bundle) -> None:
+    """Catalog release hook for Keras families: once a bundle is replaced or
+    removed, reset Keras' global state and collect, so the old models'
+    graphs and variables are freed when the last request holding them ends.
+    Models still in the catalog keep working across ``clear_session``."""
+    from tensorflow.keras import backend
+    backend.clear_session()
+    gc.collect()
+    logger.info(f"[memory] released Keras session state after {bundle.family}/{bundle.model_id}")
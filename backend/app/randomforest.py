@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import pandas as pd
 import numpy as np
 import joblib
@@ -15,8 +15,14 @@ import scipy.stats as stats
 import base64
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
 
+from app.catalog import catalog
+from app.agemodel import time_axis, plot_order, json_axis
+from app.anomalies import detect_anomalies, check_window, DEFAULT_WINDOW, DEFAULT_THRESHOLD
+from app.datasets import read_upload, bundle_columns
+from app.memory import MemoryProfile, figure_guard
+
 logger = logging.getLogger("app.rf")
-router = APIRouter(prefix="/api/analyze/rf", tags=["RandomForest"])
+router = APIRouter(prefix="/api/analyze/rf", tags=["RandomForest"], dependencies=[Depends(figure_guard)])
 
 # ─────── CONFIG ───────
 MODEL_SAVE_DIR   = Path("saved_models_rf")
@@ -28,6 +34,8 @@ TARGET_VARIABLES = [
     "Sr_Ca_measurement",
 ]
 
+catalog.register_family("rf", MODEL_SAVE_DIR, "RF_", ".pkl", joblib.load)
+
 # ─────── Helpers ───────────
 def plot_to_base64(fig: plt.Figure) -> str:
     buf = BytesIO()
@@ -79,35 +87,41 @@ def calculate_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float
 # ─────── PREDICTION ENDPOINT ───────
 @router.post("/predict")
 async def predict_rf(
-    file: UploadFile = File(...),
+    file: UploadFile | None = File(None),
+    dataset_id: str | None = None,
     model_id: str | None = None,
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
 ) -> Dict[str, Any]:
-    contents = await file.read()
-    try:
-        df = pd.read_csv(BytesIO(contents))
-    except Exception:
-        raise HTTPException(400, "Uploaded file is not a valid CSV")
-    if df.empty:
-        raise HTTPException(400, "Uploaded file is empty")
-
+    if anomalies:
+        check_window(anomaly_window)
     model_id = model_id or DEFAULT_MODEL_ID
-    model_dir = MODEL_SAVE_DIR / model_id
-    if not model_dir.exists():
+    if not (MODEL_SAVE_DIR / model_id).exists():
         raise HTTPException(404, f"Model '{model_id}' not found")
 
-    logger.info(f"[rf] 🔥 Loading RandomForest artifacts for '{model_id}'...")
+    profile = MemoryProfile()
+    df = await read_upload(file, dataset_id, bundle_columns("rf", model_id) if dataset_id else None)
+    profile.mark("upload")
+
     try:
-        # ─ Load metadata and preprocessing artifacts
-        with open(model_dir / "metadata.json") as f:
-            metadata = json.load(f)
-        
-        scaler = joblib.load(model_dir / "scaler.pkl")
-        label_encoders = joblib.load(model_dir / "label_encoders.pkl")
+        # ─ Current bundle from the catalog (metadata, preprocessors, models)
+        bundle = catalog.get("rf", model_id)
+        if bundle is None:
+            raise HTTPException(404, f"Model '{model_id}' not found")
+        metadata = bundle.metadata
+        scaler = bundle.scaler
+        label_encoders = bundle.label_encoders
 
         # ─ Preprocess incoming data
+        entity_ids = df["entity_id"].to_numpy() if "entity_id" in df.columns else None
+        years, time_axis_source = time_axis(df)
         drop_cols = ["sample_id", "site_id", "entity_id", "site_name"]
         df_proc = df.drop(columns=[c for c in drop_cols if c in df.columns], errors="ignore")
         
+        # rows where a target was measured; imputation below hides the gaps
+        measured = {t: df_proc[t].notna().to_numpy() for t in bundle.targets if t in df_proc}
+
         # Handle missing values and encoding
         num_cols = df_proc.select_dtypes(include=["float64", "int64"]).columns
         df_proc[num_cols] = df_proc[num_cols].fillna(df_proc[num_cols].median())
@@ -119,19 +133,20 @@ async def predict_rf(
         df_proc[num_cols] = scaler.transform(df_proc[num_cols])
 
         X = df_proc.drop(columns=TARGET_VARIABLES, errors="ignore")
+        profile.mark("preprocess")
 
         # ─ Predict and calculate metrics for each target
         future_past = {}
         plots = {}
         eval_metrics = {}
+        anomaly_results = {}
         
         for t in metadata.get("target_variables", TARGET_VARIABLES):
-            model_path = model_dir / f"RF_{t}.pkl"
-            if not model_path.exists():
+            model = bundle.models.get(t)
+            if model is None:
                 logger.warning(f"[rf] Missing model for '{t}'")
                 continue
-                
-            model = joblib.load(model_path)
+
             preds = model.predict(X)
             future_past[t] = preds.tolist()
 
@@ -142,6 +157,13 @@ async def predict_rf(
                 
                 # Calculate metrics
                 eval_metrics[t] = calculate_metrics(y_true, y_pred)
+
+                if anomalies:
+                    # unmeasured rows get a NaN residual, which scores 0
+                    residuals = np.where(measured[t], y_true - y_pred, np.nan)
+                    anomaly_results[t] = detect_anomalies(
+                        residuals, entity_ids, anomaly_window, anomaly_threshold
+                    )
                 
                 # Create plots
                 plots[t] = {
@@ -158,41 +180,44 @@ async def predict_rf(
                     "time_series_plot": ""
                 }
 
-        # ─ Create combined trend plot
-        n = max((len(v) for v in future_past.values()), default=0)
-        years = np.linspace(-10000, 5000, n)
-        combined_ts = plot_to_base64(create_combined_trend_plot(years, future_past))
+        profile.mark("targets")
+
+        # ─ Create combined trend plot on the age-model axis
+        combined_ts = plot_to_base64(create_combined_trend_plot(*plot_order(years, future_past)))
 
         # ─ Load any stored cross-validation metrics (optional)
         cv_metrics = {}
-        cv_path = model_dir / "cv_metrics.json"
-        if cv_path.exists():
-            with open(cv_path) as f:
-                cv_metrics = json.load(f)
-                # Clean CV metrics format
-                clean_cv = {}
-                for t, v in cv_metrics.items():
-                    scores = v.get("r2_scores", [])
-                    mean = v.get("mean_r2", np.mean(scores) if scores else 0.0)
-                    clean_cv[t] = {"mean_cv_score": float(mean)}
-                cv_metrics = clean_cv
+        if "cv_metrics" in bundle.documents:
+            # Clean CV metrics format
+            for t, v in bundle.documents["cv_metrics"].items():
+                scores = v.get("r2_scores", [])
+                mean = v.get("mean_r2", np.mean(scores) if scores else 0.0)
+                cv_metrics[t] = {"mean_cv_score": float(mean)}
 
         logger.info(f"[rf] 🌶️ RandomForest predictions served with sizzle for '{model_id}'!")
+        results = {
+            "future_past_predictions": future_past,
+            "years": json_axis(years),
+            "time_axis": time_axis_source,
+            "preprocessing": metadata.get("preprocessing_info", {}),
+            "training_metrics": eval_metrics,  # Now using actual calculated metrics
+            "evaluation_metrics": eval_metrics,
+            "training_cross_validation": cv_metrics,
+            "plots": plots,
+            "time_series_plot": combined_ts,
+        }
+        if anomalies:
+            results["anomalies"] = anomaly_results
+        profile.mark("summary_plot")
+        results["memory"] = profile.report()
         return {
             "status": "success",
-            "results": {
-                "future_past_predictions": future_past,
-                "years": years.tolist(),
-                "preprocessing": metadata.get("preprocessing_info", {}),
-                "training_metrics": eval_metrics,  # Now using actual calculated metrics
-                "evaluation_metrics": eval_metrics,
-                "training_cross_validation": cv_metrics,
-                "plots": plots,
-                "time_series_plot": combined_ts,
-            },
+            "results": results,
             "model_id": model_id,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[rf] load error: {e}", exc_info=True)
         raise HTTPException(400, f"Error loading model: {e}")
\ No newline at end of file
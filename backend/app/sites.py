@@ -0,0 +1,207 @@
+# app/sites.py
+
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, HTTPException
+from sklearn.neighbors import BallTree
+
+logger = logging.getLogger("app.sites")
+router = APIRouter(prefix="/api/sites", tags=["Sites"])
+
+# ─────── CONFIG ───────
+EARTH_RADIUS_KM = 6371.0088
+COORD_DECIMALS  = 4            # ~11 m: rows closer than this are one site
+DEFAULT_LIMIT   = int(os.environ.get("SITES_ROW_LIMIT", "5000"))
+SOURCES = {
+    # name: CSV holding per-sample rows with latitude/longitude columns
+    "predictions/xgboost":     Path("app/data/xgboost/PastFuture_Predictions_XGBoost.csv"),
+    "predictions/randomforest": Path("app/data/randomforest/PastFuture_Predictions_RF.csv"),
+    "predictions/bilstm":      Path("app/data/bilstm/PastFuture_Predictions_BiLSTM.csv"),
+    "predictions/transformer": Path("app/data/transformer/PastFuture_Predictions_Transformer.csv"),
+    "anomalies":               Path("app/data/anomalies/anomalies_full_timeseries1.csv"),
+}
+
+# ─────── Index ───────────
+def _json_scalar(v: Any) -> Any:
+    """Plain Python value for a JSON response; NaN, inf and NA become None
+    like they do in ``records``."""
+    v = v.item() if hasattr(v, "item") else v
+    if v is None or pd.isna(v) or (isinstance(v, float) and not np.isfinite(v)):
+        return None
+    return v
+
+class SiteIndex:
+    """Cave sites from every stored table, in a haversine BallTree.
+
+    Rows are grouped into sites by rounded coordinates, so tables that lack
+    a shared id still line up. For each table the row positions of every
+    site are kept, turning "rows near X" into tree lookup + index concat.
+    """
+
+    def __init__(self, frames: Dict[str, pd.DataFrame]):
+        self.frames = frames
+        coords = [
+            np.round(f[["latitude", "longitude"]].to_numpy(dtype=np.float64), COORD_DECIMALS)
+            for f in frames.values()
+        ]
+        all_coords = np.concatenate(coords) if coords else np.empty((0, 2))
+        all_coords = all_coords[np.isfinite(all_coords).all(axis=1)]
+        self.coords = np.unique(all_coords, axis=0)          # (n_sites, 2) lat, lon
+        self.tree = BallTree(np.radians(self.coords), metric="haversine") if len(self.coords) else None
+
+        # per-table: site code of every row → row positions grouped by site
+        self.rows: Dict[str, Dict[int, np.ndarray]] = {}
+        self.meta = [dict() for _ in range(len(self.coords))]
+        site_keys = pd.MultiIndex.from_arrays([self.coords[:, 0], self.coords[:, 1]])
+        for (name, frame), c in zip(frames.items(), coords):
+            codes = site_keys.get_indexer(pd.MultiIndex.from_arrays([c[:, 0], c[:, 1]]))
+            valid = np.flatnonzero(codes >= 0)
+            order = valid[np.argsort(codes[valid], kind="stable")]
+            sorted_codes = codes[order]
+            bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+            groups = [g for g in np.split(order, bounds) if len(g)]
+            self.rows[name] = {int(codes[g[0]]): g for g in groups}
+            first_rows = np.array([g[0] for g in groups], dtype=np.intp)
+            for col in ("site_id", "site_name", "entity_id", "elevation"):
+                if col in frame.columns:
+                    for code, v in zip(codes[first_rows], frame[col].to_numpy()[first_rows]):
+                        v = _json_scalar(v)
+                        if self.meta[code].get(col) is None:      # a later table may fill a gap
+                            self.meta[code][col] = v
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> np.ndarray:
+        lat, lon = self.coords[:, 0], self.coords[:, 1]
+        in_lat = (lat >= min_lat) & (lat <= max_lat)
+        # a box with min_lon > max_lon crosses the antimeridian
+        in_lon = (lon >= min_lon) & (lon <= max_lon) if min_lon <= max_lon else (lon >= min_lon) | (lon <= max_lon)
+        return np.flatnonzero(in_lat & in_lon)
+
+    def radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        if self.tree is None:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        ind, dist = self.tree.query_radius(
+            np.radians([[lat, lon]]), r=radius_km / EARTH_RADIUS_KM, return_distance=True, sort_results=True
+        )
+        return ind[0], dist[0] * EARTH_RADIUS_KM
+
+    def nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.tree is None:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        dist, ind = self.tree.query(np.radians([[lat, lon]]), k=min(k, len(self)))
+        return ind[0], dist[0] * EARTH_RADIUS_KM
+
+    def site(self, i: int, distance_km: Optional[float] = None) -> Dict[str, Any]:
+        out = {"latitude": float(self.coords[i, 0]), "longitude": float(self.coords[i, 1]), **self.meta[i]}
+        if distance_km is not None:
+            out["distance_km"] = round(float(distance_km), 3)
+        return out
+
+    def records(self, source: str, sites: np.ndarray, limit: int) -> Dict[str, Any]:
+        groups = self.rows.get(source, {})
+        parts = [groups[int(s)] for s in sites if int(s) in groups]
+        idx = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+        frame = self.frames[source].iloc[idx[:limit]]
+        frame = frame.replace({np.nan: None, np.inf: None, -np.inf: None})
+        return {"n_rows": int(len(idx)), "truncated": bool(len(idx) > limit), "rows": frame.to_dict(orient="records")}
+
+def _load_frames() -> Dict[str, pd.DataFrame]:
+    frames = {}
+    for name, path in SOURCES.items():
+        try:
+            frame = pd.read_csv(path)
+        except Exception as e:
+            logger.warning(f"[sites] skipping {name}: {e}")
+            continue
+        if {"latitude", "longitude"} <= set(frame.columns):
+            frames[name] = frame
+        else:
+            logger.warning(f"[sites] skipping {name}: no latitude/longitude columns")
+    return frames
+
+def _signature() -> tuple:
+    return tuple(p.stat().st_mtime_ns if p.exists() else None for p in SOURCES.values())
+
+_index: Optional[SiteIndex] = None
+_index_sig: Optional[tuple] = None
+_index_lock = threading.Lock()
+
+def get_index() -> SiteIndex:
+    """Current index; rebuilt only when a source file changes on disk."""
+    global _index, _index_sig
+    sig = _signature()
+    if _index is None or sig != _index_sig:
+        with _index_lock:
+            if _index is None or sig != _index_sig:
+                _index = SiteIndex(_load_frames())
+                _index_sig = sig
+                logger.info(f"[sites] indexed {len(_index)} sites from {len(_index.frames)} tables")
+    return _index
+
+def _check_query(limit: int, lats: Tuple[float, ...] = (), lons: Tuple[float, ...] = ()) -> None:
+    if limit < 1:
+        raise HTTPException(400, "limit must be at least 1")
+    if not all(-90 <= v <= 90 for v in lats):
+        raise HTTPException(400, "latitude must be between -90 and 90")
+    if not all(-180 <= v <= 180 for v in lons):
+        raise HTTPException(400, "longitude must be between -180 and 180")
+
+def _respond(index: SiteIndex, sites: np.ndarray, dists: Optional[np.ndarray], include: str, limit: int) -> Dict[str, Any]:
+    wanted = [w.strip() for w in include.split(",") if w.strip()]
+    sources = [s for s in index.frames if any(s == w or s.startswith(f"{w}/") for w in wanted)]
+    if dists is None:
+        dists = [None] * len(sites)
+    return {
+        "n_sites": int(len(sites)),
+        "sites": [index.site(i, d) for i, d in zip(sites, dists)],
+        "data": {s: index.records(s, sites, limit) for s in sources},
+    }
+
+# ─────── ENDPOINTS ───────
+@router.get("")
+def list_sites() -> Dict[str, Any]:
+    index = get_index()
+    return {"n_sites": len(index), "sources": list(index.frames), "sites": [index.site(i) for i in range(len(index))]}
+
+@router.get("/bbox")
+def sites_in_bbox(
+    min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+    include: str = "predictions,anomalies", limit: int = DEFAULT_LIMIT,
+) -> Dict[str, Any]:
+    _check_query(limit, (min_lat, max_lat), (min_lon, max_lon))
+    if min_lat > max_lat:
+        raise HTTPException(400, "min_lat must not exceed max_lat")
+    index = get_index()
+    return _respond(index, index.bbox(min_lat, max_lat, min_lon, max_lon), None, include, limit)
+
+@router.get("/radius")
+def sites_in_radius(
+    lat: float, lon: float, radius_km: float,
+    include: str = "predictions,anomalies", limit: int = DEFAULT_LIMIT,
+) -> Dict[str, Any]:
+    _check_query(limit, (lat,), (lon,))
+    if radius_km <= 0:
+        raise HTTPException(400, "radius_km must be positive")
+    index = get_index()
+    sites, dists = index.radius(lat, lon, radius_km)
+    return _respond(index, sites, dists, include, limit)
+
+@router.get("/nearest")
+def nearest_sites(
+    lat: float, lon: float, k: int = 5,
+    include: str = "predictions,anomalies", limit: int = DEFAULT_LIMIT,
+) -> Dict[str, Any]:
+    _check_query(limit, (lat,), (lon,))
+    if k < 1:
+        raise HTTPException(400, "k must be at least 1")
+    index = get_index()
+    sites, dists = index.nearest(lat, lon, k)
+    return _respond(index, sites, dists, include, limit)
@@ -0,0 +1,296 @@
+# app/training.py
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from sklearn.model_selection import KFold, train_test_split
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
+
+from app.catalog import catalog
+from app.memory import read_limited, parse_csv
+
+logger = logging.getLogger("app.training")
+router = APIRouter(prefix="/api/training", tags=["Training"])
+
+# ─────── CONFIG ───────
+N_JOBS    = int(os.environ.get("TRAINING_N_JOBS", "-1"))   # joblib convention: -1 = all cores
+MAX_JOBS  = int(os.environ.get("TRAINING_MAX_JOBS", "1"))  # concurrent training jobs
+DROP_COLS = ["sample_id", "site_id", "entity_id", "site_name"]
+TARGET_VARIABLES = [
+    "d18O_measurement",
+    "d13C_measurement",
+    "Mg_Ca_measurement",
+    "Sr_Ca_measurement",
+]
+FAMILIES = {
+    # family: (model name in metadata.json, per-target file prefix)
+    "rf":      ("RandomForest", "RF_"),
+    "xgboost": ("XGBoost", "XGB_"),
+}
+DEFAULT_PARAMS = {
+    "rf":      {"n_estimators": 200, "random_state": 42},
+    "xgboost": {"n_estimators": 500, "learning_rate": 0.05, "max_depth": 6, "random_state": 42},
+}
+
+# ─────── Jobs ───────────
+@dataclass
+class TrainingJob:
+    job_id: str
+    family: str
+    model_id: str
+    n_splits: int
+    status: str = "queued"          # queued → running → succeeded | failed
+    stage: str = ""
+    completed: int = 0
+    total: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cv_metrics: Dict[str, Any] = field(default_factory=dict)
+    test_metrics: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def progress(self) -> float:
+        return round(self.completed / self.total, 3) if self.total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "progress": self.progress}
+
+_jobs: Dict[str, TrainingJob] = {}
+_jobs_lock = threading.Lock()
+_runner = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="training")
+
+# ─────── Helpers ───────────
+def make_estimator(family: str, params: Dict[str, Any]):
+    # one core per estimator: parallelism comes from the (target, fold) fan-out
+    if family == "rf":
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(n_jobs=1, **params)
+    from xgboost import XGBRegressor
+    return XGBRegressor(n_jobs=1, **params)
+
+def preprocess_for_training(df: pd.DataFrame, targets: List[str]):
+    """Fit the preprocessors exactly the way the predict routers apply them."""
+    df_proc = df.drop(columns=[c for c in DROP_COLS if c in df.columns], errors="ignore")
+    num_cols = df_proc.select_dtypes(include=["float64", "int64"]).columns
+    cat_cols = df_proc.select_dtypes(include=["object", "category", "bool"]).columns
+    # impute features only: a filled-in target would become a made-up label
+    features = [c for c in num_cols if c not in TARGET_VARIABLES]
+    df_proc[features] = df_proc[features].fillna(df_proc[features].median())
+
+    label_encoders = {}
+    for col in cat_cols:
+        le = LabelEncoder().fit(df_proc[col].astype(str))
+        df_proc[col] = le.transform(df_proc[col].astype(str))
+        label_encoders[col] = le
+
+    scaler = StandardScaler().fit(df_proc[num_cols])
+    df_proc[num_cols] = scaler.transform(df_proc[num_cols])
+
+    X = df_proc.drop(columns=TARGET_VARIABLES, errors="ignore")
+    y = {t: df_proc[t].to_numpy() for t in targets}
+    preprocessing_info = {
+        "numeric_columns": list(num_cols),
+        "categorical_columns": list(cat_cols),
+        "feature_engineering": {"dropped_high_corr": []},
+    }
+    return X, y, scaler, label_encoders, preprocessing_info
+
+def regression_metrics(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    return {
+        "r2": float(r2_score(y_true, y_pred)),
+        "mae": float(mean_absolute_error(y_true, y_pred)),
+        "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
+    }
+
+def _fit_task(family, params, X, y, train_idx, eval_idx, target, fold):
+    """One unit of parallel work: fit on train_idx, score on eval_idx.
+
+    fold is None for the final model, which is fitted on the whole training
+    split and returned so the parent can persist it."""
+    model = make_estimator(family, params)
+    model.fit(X.iloc[train_idx], y[train_idx])
+    metrics = regression_metrics(y[eval_idx], model.predict(X.iloc[eval_idx]))
+    return target, fold, metrics, (model if fold is None else None)
+
+def write_bundle(
+    family: str,
+    model_id: str,
+    models: Dict[str, Any],
+    scaler: StandardScaler,
+    label_encoders: Dict[str, LabelEncoder],
+    metadata: Dict[str, Any],
+    cv_metrics: Dict[str, Any],
+    test_metrics: Dict[str, Any],
+) -> Path:
+    """Write the bundle to a hidden staging folder, then rename it into place
+    so the catalog watcher never sees a half-written bundle."""
+    root = catalog.spec(family).root
+    prefix = FAMILIES[family][1]
+    final = root / model_id
+    staging = root / f".{model_id}.staging-{uuid.uuid4().hex[:8]}"
+    staging.mkdir(parents=True)
+    try:
+        joblib.dump(scaler, staging / "scaler.pkl")
+        joblib.dump(label_encoders, staging / "label_encoders.pkl")
+        for t, model in models.items():
+            joblib.dump(model, staging / f"{prefix}{t}.pkl")
+        for name, doc in (("metadata", metadata), ("cv_metrics", cv_metrics), ("test_metrics", test_metrics)):
+            with open(staging / f"{name}.json", "w") as f:
+                json.dump(doc, f, indent=2)
+        os.rename(staging, final)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return final
+
+def run_training(job: TrainingJob, df: pd.DataFrame, params: Dict[str, Any], test_size: float) -> None:
+    job.status, job.stage = "running", "preprocessing"
+    try:
+        targets = [t for t in TARGET_VARIABLES if t in df.columns]
+        X, y, scaler, label_encoders, preprocessing_info = preprocess_for_training(df, targets)
+
+        tasks = []
+        for t in targets:
+            # split each target over its measured rows only; with no gaps this
+            # is the same split for every target
+            idx = np.flatnonzero(np.isfinite(y[t]))
+            train_idx, test_idx = train_test_split(idx, test_size=test_size, random_state=42)
+            folds = KFold(job.n_splits, shuffle=True, random_state=42).split(train_idx)
+            for k, (tr, va) in enumerate(folds):
+                tasks.append(delayed(_fit_task)(job.family, params, X, y[t], train_idx[tr], train_idx[va], t, k))
+            tasks.append(delayed(_fit_task)(job.family, params, X, y[t], train_idx, test_idx, t, None))
+        job.total, job.stage = len(tasks), "fitting"
+
+        fold_scores = {t: [None] * job.n_splits for t in targets}
+        models, test_metrics = {}, {}
+        parallel = Parallel(n_jobs=N_JOBS, return_as="generator_unordered")
+        for t, fold, metrics, model in parallel(tasks):
+            if fold is None:
+                models[t], test_metrics[t] = model, metrics
+            else:
+                fold_scores[t][fold] = metrics["r2"]
+            job.completed += 1
+
+        cv_metrics = {
+            t: {
+                "r2_scores": scores,
+                "mean_r2": float(np.mean(scores)),
+                "std_r2": float(np.std(scores)),
+                "mean_cv_score": float(np.mean(scores)),
+            }
+            for t, scores in fold_scores.items()
+        }
+        metadata = {
+            "model": FAMILIES[job.family][0],
+            "target_variables": targets,
+            "preprocessing_info": preprocessing_info,
+            "training": {
+                "job_id": job.job_id,
+                "n_rows": int(len(df)),
+                "n_splits": job.n_splits,
+                "test_size": test_size,
+                "params": params,
+            },
+        }
+        job.stage = "writing bundle"
+        path = write_bundle(job.family, job.model_id, models, scaler, label_encoders, metadata, cv_metrics, test_metrics)
+        job.cv_metrics, job.test_metrics = cv_metrics, test_metrics
+        job.status, job.stage = "succeeded", "done"
+        logger.info(f"[training] {job.job_id}: wrote {path}")
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+        logger.error(f"[training] {job.job_id} failed: {e}", exc_info=True)
+    finally:
+        job.finished_at = time.time()
+
+# ─────── ENDPOINTS ───────
+@router.post("/jobs")
+def submit_training_job(
+    file: UploadFile = File(...),
+    family: str = "rf",
+    model_id: str | None = None,
+    n_splits: int = 5,
+    test_size: float = 0.2,
+    params: str | None = None,
+) -> Dict[str, Any]:
+    """Queue a k-fold training run that produces a new model bundle.
+
+    ``params`` is an optional JSON object of estimator hyper-parameters."""
+    family = family.lower()
+    if family not in FAMILIES:
+        raise HTTPException(400, f"Training is supported for {', '.join(FAMILIES)}; got '{family}'")
+    if n_splits < 2:
+        raise HTTPException(400, "n_splits must be at least 2")
+    if not 0 < test_size < 1:
+        raise HTTPException(400, "test_size must be between 0 and 1")
+    try:
+        overrides = json.loads(params) if params else {}
+    except json.JSONDecodeError:
+        raise HTTPException(400, "params must be a JSON object")
+    if not isinstance(overrides, dict):
+        raise HTTPException(400, "params must be a JSON object")
+    hyper = {**DEFAULT_PARAMS[family], **overrides}
+    # build the estimator once now so bad hyper-parameters fail the request,
+    # not the background job
+    try:
+        known = make_estimator(family, {}).get_params()
+        unknown = sorted(set(hyper) - set(known))
+        if unknown:
+            raise ValueError(f"unknown parameter(s) {', '.join(unknown)}")
+        make_estimator(family, hyper)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, f"Invalid params for {family}: {e}")
+
+    df = parse_csv(read_limited(file))
+    if not any(t in df.columns for t in TARGET_VARIABLES):
+        raise HTTPException(400, "Upload contains none of the target columns")
+    if len(df) < 2 * n_splits:
+        raise HTTPException(400, f"Need at least {2 * n_splits} rows for {n_splits}-fold CV")
+    for t in TARGET_VARIABLES:
+        if t in df.columns and df[t].notna().sum() < 2 * n_splits:
+            raise HTTPException(
+                400, f"Target '{t}' has {int(df[t].notna().sum())} measured rows; {n_splits}-fold CV needs {2 * n_splits}"
+            )
+
+    job_id = uuid.uuid4().hex[:12]
+    model_id = model_id or f"{family}_{time.strftime('%Y%m%d_%H%M%S')}_{job_id[:4]}"
+    if Path(model_id).name != model_id or model_id.startswith("."):
+        raise HTTPException(400, f"Invalid model_id '{model_id}'")
+    if (catalog.spec(family).root / model_id).exists():
+        raise HTTPException(409, f"Model '{model_id}' already exists")
+
+    job = TrainingJob(job_id=job_id, family=family, model_id=model_id, n_splits=n_splits)
+    with _jobs_lock:
+        _jobs[job_id] = job
+    _runner.submit(run_training, job, df, hyper, test_size)
+    logger.info(f"[training] {job_id}: queued {family} → '{model_id}' ({len(df)} rows)")
+    return job.to_dict()
+
+@router.get("/jobs")
+def list_training_jobs() -> Dict[str, Any]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return {"jobs": [j.to_dict() for j in sorted(jobs, key=lambda j: j.created_at, reverse=True)]}
+
+@router.get("/jobs/{job_id}")
+def get_training_job(job_id: str) -> Dict[str, Any]:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Training job '{job_id}' not found")
+    return job.to_dict()
@@ -9,7 +9,7 @@ import absl.logging
 absl.logging.set_verbosity(absl.logging.FATAL)
 absl.logging.set_stderrthreshold("fatal")
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import pandas as pd
 import numpy as np
 import joblib
@@ -28,8 +28,15 @@ import scipy.stats as stats
 import base64
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
 
+from app.catalog import catalog
+from app.agemodel import time_axis, plot_order, json_axis
+from app.anomalies import detect_anomalies, check_window, DEFAULT_WINDOW, DEFAULT_THRESHOLD
+from app.datasets import read_upload, bundle_columns
+from app.memory import MemoryProfile, figure_guard, release_keras, keras_model_bytes
+from app.uncertainty import mc_dropout_predict, check_passes, DEFAULT_PASSES
+
 logger = logging.getLogger("app.transformer")
-router = APIRouter(prefix="/api/analyze/transformer", tags=["Transformer"])
+router = APIRouter(prefix="/api/analyze/transformer", tags=["Transformer"], dependencies=[Depends(figure_guard)])
 
 # ─────── CONFIG ───────
 MODEL_SAVE_DIR = Path("saved_models_transformer")
@@ -40,6 +47,11 @@ TARGET_VARIABLES = [
     "Sr_Ca_measurement",
 ]
 
+catalog.register_family(
+    "transformer", MODEL_SAVE_DIR, "Transformer_", ".keras", lambda p: load_model(str(p)),
+    release=release_keras, sizer=keras_model_bytes,
+)
+
 # ─────────── Helpers ───────────
 def create_sequences(
     X: pd.DataFrame,
@@ -84,26 +96,39 @@ def create_qq_plot(y_true: np.ndarray, y_pred: np.ndarray, target: str) -> plt.F
 
 # ─────── PREDICTION ───────
 async def predict_with_saved_model(
-    df: pd.DataFrame, model_id: str
+    df: pd.DataFrame,
+    model_id: str,
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
+    uncertainty: bool = False,
+    mc_passes: int = DEFAULT_PASSES,
+    profile: MemoryProfile | None = None,
 ) -> Dict[str, Any]:
-    model_dir = MODEL_SAVE_DIR / model_id
-    if not model_dir.exists():
+    profile = profile or MemoryProfile()
+    if not (MODEL_SAVE_DIR / model_id).exists():
         raise HTTPException(404, f"Model '{model_id}' not found")
 
     try:
-        # Load metadata
-        with open(model_dir / "metadata.json", "r") as f:
-            metadata = json.load(f)
+        # Current bundle from the catalog
+        bundle = catalog.get("transformer", model_id)
+        if bundle is None:
+            raise HTTPException(404, f"Model '{model_id}' not found")
+        metadata = bundle.metadata
 
         time_steps = metadata.get("time_steps", 10)
         
-        # Load preprocessing objects
-        scaler = joblib.load(model_dir / "scaler.pkl")
-        label_encoders = joblib.load(model_dir / "label_encoders.pkl")
+        # Preprocessing objects
+        scaler = bundle.scaler
+        label_encoders = bundle.label_encoders
 
         # Preprocess data
+        entity_ids = df["entity_id"].to_numpy() if "entity_id" in df.columns else None
+        years, time_axis_source = time_axis(df, offset=time_steps)
         drop_cols = ["sample_id", "site_id", "entity_id", "site_name"]
         df = df.drop(columns=[c for c in drop_cols if c in df.columns], errors="ignore")
+        # rows where a target was measured; imputation below hides the gaps
+        measured = {t: df[t].notna().to_numpy() for t in bundle.targets if t in df.columns}
         num_cols = df.select_dtypes(include=["float64", "int64"]).columns
         df[num_cols] = df[num_cols].fillna(df[num_cols].median())
         
@@ -113,30 +138,29 @@ async def predict_with_saved_model(
         
         df[num_cols] = scaler.transform(df[num_cols])
         X = df.drop(columns=TARGET_VARIABLES, errors="ignore")
+        profile.mark("preprocess")
 
-        # Determine targets
-        targets = metadata.get("target_variables", [])
-        if not targets:
-            targets = [p.stem.replace("Transformer_", "") for p in model_dir.glob("Transformer_*.keras")]
+        # Targets with a loaded model
+        targets = bundle.targets
 
         # Initialize response structure
         response = {
             "predictions": {},
             "plots": {},
-            "metrics": {}
+            "metrics": {},
+            "anomalies": {},
+            "uncertainty": {}
         }
 
         for target in targets:
-            model_path = model_dir / f"Transformer_{target}.keras"
-            if not model_path.exists():
-                continue
-            
-            model = load_model(str(model_path))
+            model = bundle.models[target]
             
             # Create sequences and predict
             dummy_y = pd.Series(np.zeros(len(X)))
             X_seq, _ = create_sequences(X, dummy_y, time_steps)
             predictions = model.predict(X_seq, verbose=0).flatten()
+            if uncertainty:
+                response["uncertainty"][target] = mc_dropout_predict(model, X_seq, mc_passes)
             
             # Get actual values for evaluation
             _, y_true_full = create_sequences(X, pd.Series(df[target].values), time_steps)
@@ -161,6 +185,15 @@ async def predict_with_saved_model(
                 "rmse": rmse
             }
             
+            if anomalies:
+                # residual i belongs to upload row i + time_steps; unmeasured rows score 0
+                rows = slice(time_steps, time_steps + len(y_true))
+                groups = entity_ids[rows] if entity_ids is not None else None
+                residuals = np.where(measured[target][rows], y_true - y_pred, np.nan)
+                response["anomalies"][target] = detect_anomalies(
+                    residuals, groups, anomaly_window, anomaly_threshold, offset=time_steps
+                )
+            
             # Generate plots
             response["plots"][target] = {
                 "prediction_plot": plot_to_base64(create_prediction_plot(y_true, y_pred, target)),
@@ -168,18 +201,30 @@ async def predict_with_saved_model(
                 "qq_plot": plot_to_base64(create_qq_plot(y_true, y_pred, target))
             }
 
+        profile.mark("targets")
+
         # Return the response in the format expected by frontend
         logger.info(f"🌟 [transformer] Predictions served fresh for model '{model_id}' 🚀🧠")
-        return {
+        payload = {
             "status": "success",
             "model_type": "transformer",
             "predictions": response["predictions"],
             "plots": response["plots"],
             "metrics": response["metrics"],
+            "years": json_axis(years),
+            "time_axis": time_axis_source,
             "cv_metrics": metadata.get("cv_metrics", {}),
             "preprocessing": metadata.get("preprocessing_info", {})
         }
+        if anomalies:
+            payload["anomalies"] = response["anomalies"]
+        if uncertainty:
+            payload["uncertainty"] = response["uncertainty"]
+        payload["memory"] = profile.report()
+        return payload
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in transformer prediction: {str(e)}", exc_info=True)
         raise HTTPException(500, f"Prediction error: {str(e)}")
@@ -187,18 +232,30 @@ async def predict_with_saved_model(
 # ─────── ENDPOINT ───────
 @router.post("/predict")
 async def predict_transformer(
-    file: UploadFile = File(...),
+    file: UploadFile | None = File(None),
+    dataset_id: str | None = None,
     model_id: str = "pretrained_transformer",
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
+    uncertainty: bool = False,
+    mc_passes: int = DEFAULT_PASSES,
 ) -> Dict[str, Any]:
     try:
-        contents = await file.read()
-        df = pd.read_csv(BytesIO(contents))
-        
-        if df.empty:
-            raise HTTPException(400, "Uploaded file is empty")
+        if anomalies:
+            check_window(anomaly_window)
+        if uncertainty:
+            check_passes(mc_passes)
+        profile = MemoryProfile()
+        df = await read_upload(file, dataset_id, bundle_columns("transformer", model_id) if dataset_id else None)
+        profile.mark("upload")
             
-        return await predict_with_saved_model(df, model_id)
+        return await predict_with_saved_model(
+            df, model_id, anomalies, anomaly_window, anomaly_threshold, uncertainty, mc_passes, profile
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing transformer prediction: {str(e)}", exc_info=True)
         raise HTTPException(500, f"Error processing request: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,88 @@
+# app/uncertainty.py
+
+import os
+import weakref
+import threading
+import numpy as np
+from typing import Dict, Any
+from fastapi import HTTPException
+
+# ─────── CONFIG ───────
+DEFAULT_PASSES  = int(os.environ.get("MC_DROPOUT_PASSES", "30"))
+MIN_PASSES      = 2
+MAX_PASSES      = int(os.environ.get("MC_DROPOUT_MAX_PASSES", "200"))
+# windows per forward call, passes included: bounds both the activations
+# (rows × time_steps × units) and the (passes × windows) sample block
+BATCH_ROWS      = int(os.environ.get("MC_DROPOUT_BATCH_ROWS", "2048"))
+QUANTILES       = (0.05, 0.5, 0.95)
+
+_mc_models: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_mc_lock = threading.Lock()
+
+# ─────── Monte-Carlo dropout ───────────
+def mc_model(model):
+    """A twin of ``model`` whose Dropout layers always drop, built once per
+    model. Every other layer is shared (same weights, no copy) and runs in
+    inference mode, so BatchNormalization keeps its moving statistics and the
+    catalog's model is never put into training mode. Dropout applied inside
+    RNN cells (``recurrent_dropout``) stays off."""
+    import keras
+
+    class AlwaysOnDropout(keras.layers.Layer):
+        def __init__(self, inner):
+            super().__init__(name=f"mc_{inner.name}")
+            self.inner = inner
+
+        def call(self, x, training=None):
+            return self.inner(x, training=True)
+
+    with _mc_lock:
+        twin = _mc_models.get(model)
+        if twin is None:
+            twin = keras.models.clone_model(
+                model,
+                clone_function=lambda layer: AlwaysOnDropout(layer) if isinstance(layer, keras.layers.Dropout) else layer,
+            )
+            _mc_models[model] = twin
+    return twin
+
+def check_passes(n_passes: int) -> None:
+    """Reject an MC pass count outside [MIN_PASSES, MAX_PASSES] before any work."""
+    if not MIN_PASSES <= n_passes <= MAX_PASSES:
+        raise HTTPException(400, f"mc_passes must be between {MIN_PASSES} and {MAX_PASSES}")
+
+def mc_dropout_samples(model, X_seq: np.ndarray, n_passes: int = DEFAULT_PASSES) -> np.ndarray:
+    """Run ``n_passes`` stochastic forward passes with dropout active, laid
+    end to end as one batch of ``n_passes × len(X_seq)`` windows in a single
+    call. Returns an array of shape (n_passes, len(X_seq))."""
+    X_seq = np.asarray(X_seq, dtype=np.float32)
+    batch = np.tile(X_seq, (n_passes,) + (1,) * (X_seq.ndim - 1))
+    preds = mc_model(model)(batch, training=False)
+    return np.asarray(preds).reshape(n_passes, len(X_seq), -1)[:, :, 0]
+
+def mc_dropout_predict(
+    model,
+    X_seq: np.ndarray,
+    n_passes: int = DEFAULT_PASSES,
+    batch_rows: int = BATCH_ROWS,
+) -> Dict[str, Any]:
+    """Per-window mean, std and quantiles across ``n_passes`` MC passes.
+
+    Windows are processed in blocks of ``batch_rows // n_passes``: each block
+    runs all of its passes in one call and is summarised before the next, so
+    the sample matrix never exceeds ``batch_rows`` values, however long the
+    upload is.
+    """
+    check_passes(n_passes)
+    n = len(X_seq)
+    block = max(1, batch_rows // n_passes)
+    names = ["mean", "std", *(f"q{int(round(q * 100)):02d}" for q in QUANTILES)]
+    stats = {k: np.empty(n) for k in names}
+    for s in range(0, n, block):
+        samples = mc_dropout_samples(model, X_seq[s : s + block], n_passes)
+        e = s + samples.shape[1]
+        stats["mean"][s:e] = samples.mean(axis=0)
+        stats["std"][s:e] = samples.std(axis=0)
+        for k, vals in zip(names[2:], np.quantile(samples, QUANTILES, axis=0)):
+            stats[k][s:e] = vals
+    return {"n_passes": n_passes, **{k: v.tolist() for k, v in stats.items()}}
@@ -1,6 +1,6 @@
 # app/xgboost.py
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import pandas as pd
 import numpy as np
 import joblib
@@ -16,8 +16,14 @@ import seaborn as sns
 import scipy.stats as stats
 import base64
 
+from app.catalog import catalog, BASE_FILES
+from app.agemodel import time_axis, plot_order, json_axis
+from app.anomalies import detect_anomalies, check_window, DEFAULT_WINDOW, DEFAULT_THRESHOLD
+from app.datasets import read_upload, bundle_columns
+from app.memory import MemoryProfile, figure_guard
+
 logger = logging.getLogger("app.xgboost")
-router = APIRouter(prefix="/api/analyze/xgboost", tags=["XGBoost"])
+router = APIRouter(prefix="/api/analyze/xgboost", tags=["XGBoost"], dependencies=[Depends(figure_guard)])
 
 # ─────── CONFIG ───────
 MODEL_SAVE_DIR   = Path("saved_models_xgboost")
@@ -29,6 +35,11 @@ TARGET_VARIABLES = [
     "Sr_Ca_measurement",
 ]
 
+catalog.register_family(
+    "xgboost", MODEL_SAVE_DIR, "XGB_", ".pkl", joblib.load,
+    required=BASE_FILES + ("test_metrics.json", "cv_metrics.json"),
+)
+
 # ─────── Helpers ───────────
 def plot_to_base64(fig: plt.Figure) -> str:
     buf = BytesIO()
@@ -60,27 +71,33 @@ def create_short_ts_plot(y_true: np.ndarray, y_pred: np.ndarray, target: str) ->
 # ─────── PREDICTION ENDPOINT ───────
 @router.post("/predict")
 async def predict_xgboost(
-    file: UploadFile = File(...),
+    file: UploadFile | None = File(None),
+    dataset_id: str | None = None,
     model_id: str | None = None,
+    anomalies: bool = False,
+    anomaly_window: int = DEFAULT_WINDOW,
+    anomaly_threshold: float = DEFAULT_THRESHOLD,
 ) -> Dict[str, Any]:
-    contents = await file.read()
-    try:
-        df = pd.read_csv(BytesIO(contents))
-    except Exception:
-        raise HTTPException(400, "Uploaded file is not a valid CSV")
-    if df.empty:
-        raise HTTPException(400, "Uploaded file is empty")
-
+    if anomalies:
+        check_window(anomaly_window)
     model_id = model_id or DEFAULT_MODEL_ID
-    model_dir = MODEL_SAVE_DIR / model_id
-    if not model_dir.exists():
+    if not (MODEL_SAVE_DIR / model_id).exists():
         raise HTTPException(404, f"Model '{model_id}' not found")
 
+    profile = MemoryProfile()
+    df = await read_upload(file, dataset_id, bundle_columns("xgboost", model_id) if dataset_id else None)
+    profile.mark("upload")
+
     try:
-        # ─ load metadata & metrics
-        with open(model_dir / "metadata.json")    as f: metadata     = json.load(f)
-        with open(model_dir / "test_metrics.json") as f: test_metrics = json.load(f)
-        with open(model_dir / "cv_metrics.json")   as f: cv_metrics   = json.load(f)
+        # ─ current bundle from the catalog
+        bundle = catalog.get("xgboost", model_id)
+        if bundle is None:
+            raise HTTPException(404, f"Model '{model_id}' not found")
+
+        # ─ metadata & metrics
+        metadata     = bundle.metadata
+        test_metrics = dict(bundle.documents["test_metrics"])
+        cv_metrics   = bundle.documents["cv_metrics"]
 
         # sanitize test_metrics
         for t in TARGET_VARIABLES:
@@ -97,13 +114,17 @@ async def predict_xgboost(
             if isinstance(v, dict) and "mean_cv_score" in v
         }
 
-        # ─ load preprocessors
-        scaler         = joblib.load(model_dir / "scaler.pkl")
-        label_encoders = joblib.load(model_dir / "label_encoders.pkl")
+        # ─ preprocessors
+        scaler         = bundle.scaler
+        label_encoders = bundle.label_encoders
 
         # ─ preprocess incoming df
+        entity_ids = df["entity_id"].to_numpy() if "entity_id" in df.columns else None
+        years, time_axis_source = time_axis(df)
         drop_cols = ["sample_id", "site_id", "entity_id", "site_name"]
         df_proc = df.drop(columns=[c for c in drop_cols if c in df.columns], errors="ignore")
+        # rows where a target was measured; imputation below hides the gaps
+        measured = {t: df_proc[t].notna().to_numpy() for t in bundle.targets if t in df_proc}
         num_cols = df_proc.select_dtypes(include=["float64", "int64"]).columns
         df_proc[num_cols] = df_proc[num_cols].fillna(df_proc[num_cols].median())
         for col, le in label_encoders.items():
@@ -112,17 +133,18 @@ async def predict_xgboost(
         df_proc[num_cols] = scaler.transform(df_proc[num_cols])
 
         X = df_proc.drop(columns=TARGET_VARIABLES, errors="ignore")
+        profile.mark("preprocess")
 
         # ─ predict per target & build plots
         future_past = {}
         plots       = {}
+        anomaly_results = {}
         for t in metadata.get("target_variables", TARGET_VARIABLES):
-            pth = model_dir / f"XGB_{t}.pkl"
-            if not pth.exists():
+            model = bundle.models.get(t)
+            if model is None:
                 logger.warning(f"[xgboost] Missing model file for '{t}'")
                 continue
 
-            model = joblib.load(pth)
             preds = model.predict(X)
             future_past[t] = preds.tolist()
 
@@ -130,19 +152,26 @@ async def predict_xgboost(
             y_true = df_proc[t].values if t in df_proc else preds
             y_true_seq = y_true[: len(preds)]
 
+            if anomalies and t in df_proc:
+                # unmeasured rows get a NaN residual, which scores 0
+                residuals = np.where(measured[t], y_true_seq - preds, np.nan)
+                anomaly_results[t] = detect_anomalies(
+                    residuals, entity_ids, anomaly_window, anomaly_threshold
+                )
+
             plots[t] = {
                 "residual_plot":    plot_to_base64(create_residual_plot(y_true_seq, preds, t)),
                 "qq_plot":          plot_to_base64(create_qq_plot(y_true_seq, preds, t)),
                 "time_series_plot": plot_to_base64(create_short_ts_plot(y_true_seq, preds, t)),
             }
 
-        # ─ build deep-time combined plot
-        # span –10000→+5000 with same number of points
-        n = len(next(iter(future_past.values()), []))
-        years = np.linspace(-10000, 5000, n)
+        profile.mark("targets")
+
+        # ─ build deep-time combined plot on the age-model axis
+        plot_years, plot_series = plot_order(years, future_past)
         fig, ax = plt.subplots(figsize=(10, 5))
-        for t, vals in future_past.items():
-            ax.plot(years, vals, label=t)
+        for t, vals in plot_series.items():
+            ax.plot(plot_years, vals, label=t)
         ax.axvline(0, color="r", linestyle="--", label="Present")
         ax.set_xlabel("Years (Past→Future)")
         ax.set_ylabel("Predicted Value")
@@ -153,21 +182,29 @@ async def predict_xgboost(
         logger.info(f"🚀 [xgboost] Quantum trees unleashed for '{model_id}' — predictions served hot! 🍾")
 
         # ─ return payload
+        results = {
+            "future_past_predictions":   future_past,
+            "years":                     json_axis(years),
+            "time_axis":                 time_axis_source,
+            "preprocessing":             metadata.get("preprocessing_info", {}),
+            "training_metrics":          test_metrics,
+            "evaluation_metrics":        test_metrics,
+            "training_cross_validation": clean_cv,
+            "plots":                     plots,
+            "time_series_plot":          combined_ts,
+        }
+        if anomalies:
+            results["anomalies"] = anomaly_results
+        profile.mark("summary_plot")
+        results["memory"] = profile.report()
         return {
             "status": "success",
-            "results": {
-                "future_past_predictions":   future_past,
-                "years":                     years.tolist(),
-                "preprocessing":             metadata.get("preprocessing_info", {}),
-                "training_metrics":          test_metrics,
-                "evaluation_metrics":        test_metrics,
-                "training_cross_validation": clean_cv,
-                "plots":                     plots,
-                "time_series_plot":          combined_ts,
-            },
+            "results": results,
             "model_id": model_id,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[xgboost] load error: {e}", exc_info=True)
         raise HTTPException(400, f"Error loading model: {e}")
@@ -1,5 +1,5 @@
 import React, { useState, useCallback, useEffect } from "react";
-import axios from "axios";
+import { predictDataset } from "../services/api";
 import styled, { keyframes, css } from "styled-components";
 import { fadeIn, zoomIn, slideInUp } from 'react-animations';
 import { PulseLoader } from 'react-spinners';
@@ -1021,6 +1021,7 @@ function ResultsPage({ results }) {
   const [response, setResponse] = useState(results);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [datasetId, setDatasetId] = useState(null);
   const [success, setSuccess] = useState(false);
   const [activePlotType, setActivePlotType] = useState("time_series");
   const [activeModel, setActiveModel] = useState("xgboost");
@@ -1036,6 +1037,7 @@ function ResultsPage({ results }) {
   const onDrop = useCallback(acceptedFiles => {
     if (acceptedFiles.length > 0) {
       setFile(acceptedFiles[0]);
+      setDatasetId(null);
       setError(null);
       setSuccess(false);
       setResponse(null);
@@ -1058,9 +1060,6 @@ function ResultsPage({ results }) {
     setError(null);
     setSuccess(false);
 
-    const formData = new FormData();
-    formData.append("file", file);
-
     try {
       let endpoint;
       switch (activeModel) {
@@ -1077,11 +1076,8 @@ function ResultsPage({ results }) {
           endpoint = "http://localhost:8000/api/analyze/xgboost/predict";
       }
 
-      const res = await axios.post(endpoint, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      const { res, datasetId: id } = await predictDataset(endpoint, file, datasetId);
+      setDatasetId(id);
 
       if (res.data) {
         const modelResponse = activeModel === 'transformer' ? res.data : (res.data.results || res.data);
@@ -1136,7 +1132,8 @@ function ResultsPage({ results }) {
     
     // Add data rows
     response.years.forEach((year, idx) => {
-      const row = [Math.round(year)];
+      // undated rows come back as null; leave their year blank
+      const row = [year == null ? "" : Math.round(year)];
       Object.values(response.future_past_predictions).forEach(values => {
         row.push(values[idx]?.toFixed(4) || "");
       });
@@ -1661,7 +1658,7 @@ function ResultsPage({ results }) {
                     scale: 1.01
                   }}
                 >
-                  <td>{Math.round(year)}</td>
+                  <td>{year == null ? "—" : Math.round(year)}</td>
                   {Object.values(response.future_past_predictions).map((values, i) => (
                     <td key={i}>{values[idx]?.toFixed(4)}</td>
                   ))}
@@ -1,5 +1,5 @@
 import React, { useState, useCallback } from "react";
-import axios from "axios";
+import { predictDataset } from "../services/api";
 import styled, { keyframes } from "styled-components";
 import { fadeIn } from 'react-animations';
 import { PulseLoader } from 'react-spinners';
@@ -285,12 +285,14 @@ function UploadPage() {
   const [response, setResponse] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [datasetId, setDatasetId] = useState(null);
   const [success, setSuccess] = useState(false);
   const [activePlotType, setActivePlotType] = useState("time_series");
 
   const onDrop = useCallback(acceptedFiles => {
     if (acceptedFiles.length > 0) {
       setFile(acceptedFiles[0]);
+      setDatasetId(null);
       setError(null);
       setSuccess(false);
       setResponse(null);
@@ -313,19 +315,13 @@ function UploadPage() {
     setError(null);
     setSuccess(false);
 
-    const formData = new FormData();
-    formData.append("file", file);
-
     try {
-      const res = await axios.post(
-        "http://localhost:8000/api/analyze/rf/predict", 
-        formData, 
-        {
-          headers: {
-            'Content-Type': 'multipart/form-data'
-          }
-        }
+      const { res, datasetId: id } = await predictDataset(
+        "http://localhost:8000/api/analyze/rf/predict",
+        file,
+        datasetId
       );
+      setDatasetId(id);
 
       console.log("Full response:", res.data); // Debugging
 
@@ -456,7 +452,7 @@ function UploadPage() {
               <tbody>
                 {response.years.map((year, idx) => (
                   <tr key={idx}>
-                    <td>{year.toFixed(1)}</td>
+                    <td>{year == null ? "—" : year.toFixed(1)}</td>
                     {Object.values(response.future_past_predictions).map((values, i) => (
                       <td key={i}>{values[idx].toFixed(4)}</td>
                     ))}
@@ -13,3 +13,26 @@ export const getXgbPeriodSummary = () => axios.get(`${API_URL}/summary/xgb-perio
 export const getModelAgreement = () => axios.get(`${API_URL}/summary/model-agreement`);
 export const getGS20PerCave = () => axios.get(`${API_URL}/gs20/per-cave`);
 export const getGS20ChangePoints = () => axios.get(`${API_URL}/gs20/changepoints`);
+
+// Uploads are registered once; predict calls then reference them by dataset_id
+export const uploadDataset = (file) => {
+  const formData = new FormData();
+  formData.append("file", file);
+  return axios.post(`${API_URL}/api/datasets`, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' }
+  });
+};
+
+export const predictDataset = async (endpoint, file, datasetId) => {
+  const predict = (id) => axios.post(endpoint, null, { params: { dataset_id: id } });
+  if (datasetId) {
+    try {
+      return { res: await predict(datasetId), datasetId };
+    } catch (err) {
+      // the server evicted an idle dataset; register the file again below
+      if (err.response?.status !== 404 || !String(err.response?.data?.detail).startsWith("Dataset")) throw err;
+    }
+  }
+  const { data } = await uploadDataset(file);
+  return { res: await predict(data.dataset_id), datasetId: data.dataset_id };
+};